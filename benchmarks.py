@@ -0,0 +1,235 @@
+#!/usr/bin/python
+"""
+Benchmarks for objgraph.
+
+Builds synthetic heaps of various shapes and sizes, times every objgraph
+API on each of them, measures peak memory allocated during each call, and
+writes the results to a JSON file so that different versions can be
+compared:
+
+    python benchmarks.py -o before.json
+    ... hack hack hack ...
+    python benchmarks.py -o after.json --compare before.json
+
+Use --sizes to pick the heap sizes (the default is 1 and 10 million
+objects, which needs a couple of gigabytes of RAM) and --heaps/--benchmarks
+to run only some of the benchmarks.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from io import StringIO
+
+import objgraph
+
+
+class Node(object):
+    __slots__ = ('next', 'payload')
+
+    def __init__(self, next=None, payload=None):
+        self.next = next
+        self.payload = payload
+
+
+# The heap being benchmarked is stored in a module global so that
+# find_backref_chain() can find a path from a module to it.
+HEAP = None
+
+
+#
+# Heap shapes.  Each builder creates roughly n GC-tracked objects and
+# returns (root, target), where target is an object deep inside the heap.
+#
+
+def build_objects(n):
+    """Many small unrelated objects."""
+    root = [Node() for i in range(n)]
+    return root, root[-1]
+
+
+def build_wide_dict(n):
+    """One huge dict of small lists."""
+    root = {i: [i] for i in range(n)}
+    return root, root[n - 1]
+
+
+def build_deep_chain(n):
+    """A single linked list, n nodes long."""
+    root = None
+    for i in range(n):
+        root = Node(root)
+    target = root
+    while target.next is not None:
+        target = target.next
+    return root, target
+
+
+def build_big_cycle(n):
+    """A linked list closed into one big ring."""
+    root, target = build_deep_chain(n)
+    target.next = root
+    return root, target
+
+
+HEAPS = {
+    'objects': build_objects,
+    'wide_dict': build_wide_dict,
+    'deep_chain': build_deep_chain,
+    'big_cycle': build_big_cycle,
+}
+
+
+#
+# Benchmarks.  Each function receives the target object, does any
+# necessary setup, and returns the callable to be timed.
+#
+
+def bench_count(target):
+    return lambda: objgraph.count('Node')
+
+
+def bench_typestats(target):
+    return lambda: objgraph.typestats(threads=1)
+
+
+def bench_typestats_parallel(target):
+    # Same as typestats on builds of Python that have a GIL.
+    return lambda: objgraph.typestats(threads=os.cpu_count())
+
+
+def bench_growth(target):
+    return lambda: objgraph.growth(limit=None, peak_stats={})
+
+
+def bench_get_new_ids(target):
+    state = {}
+    objgraph.get_new_ids(limit=0, _state=state)
+    return lambda: objgraph.get_new_ids(limit=0, _state=state)
+
+
+def bench_get_leaking_objects(target):
+    return objgraph.get_leaking_objects
+
+
+def bench_find_backref_chain(target):
+    return lambda: objgraph.find_backref_chain(target,
+                                               objgraph.is_proper_module)
+
+
+def bench_show_refs(target):
+    return lambda: objgraph.show_refs([target], output=StringIO())
+
+
+def bench_show_backrefs(target):
+    return lambda: objgraph.show_backrefs([target], output=StringIO())
+
+
+BENCHMARKS = {
+    'count': bench_count,
+    'typestats': bench_typestats,
+    'typestats_parallel': bench_typestats_parallel,
+    'growth': bench_growth,
+    'get_new_ids': bench_get_new_ids,
+    'get_leaking_objects': bench_get_leaking_objects,
+    'find_backref_chain': bench_find_backref_chain,
+    'show_refs': bench_show_refs,
+    'show_backrefs': bench_show_backrefs,
+}
+
+
+def measure(fn, repeat=3, memory=True):
+    """Time fn() and measure the peak memory it allocates.
+
+    Returns (best time in seconds, peak memory in bytes).  The memory is
+    measured in a separate run, because tracemalloc slows everything down.
+    """
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def run(sizes, heaps, benchmarks, repeat=3, memory=True, file=sys.stdout):
+    global HEAP
+    results = []
+    for size in sizes:
+        for heap in heaps:
+            HEAP, target = HEAPS[heap](size)
+            for name in benchmarks:
+                fn = BENCHMARKS[name](target)
+                seconds, peak = measure(fn, repeat=repeat, memory=memory)
+                del fn
+                results.append(dict(heap=heap, size=size, benchmark=name,
+                                    seconds=seconds, peak_bytes=peak))
+                print('%-10s %9d %-20s %10.4fs %12s' % (
+                    heap, size, name, seconds,
+                    '-' if peak is None else '%d bytes' % peak), file=file)
+            HEAP = target = None
+    return results
+
+
+def compare(results, baseline, file=sys.stdout):
+    """Print how the results changed compared to a baseline."""
+    old = {(r['heap'], r['size'], r['benchmark']): r
+           for r in baseline['results']}
+    for r in results:
+        o = old.get((r['heap'], r['size'], r['benchmark']))
+        if o is None or not o['seconds']:
+            continue
+        print('%-10s %9d %-20s %10.4fs -> %10.4fs (%+.0f%%)' % (
+            r['heap'], r['size'], r['benchmark'], o['seconds'], r['seconds'],
+            (r['seconds'] / o['seconds'] - 1) * 100), file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark objgraph on synthetic heaps.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000000, 10000000],
+                        help='heap sizes in objects (default: %(default)s)')
+    parser.add_argument('--heaps', nargs='+', choices=sorted(HEAPS),
+                        default=sorted(HEAPS), help='heap shapes to use')
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS),
+                        default=list(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='report the best of this many runs')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help="don't measure peak memory usage")
+    parser.add_argument('-o', '--output', help='write results to this file')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='compare with results saved in this file')
+    args = parser.parse_args()
+    results = run(args.sizes, args.heaps, args.benchmarks,
+                  repeat=args.repeat, memory=args.memory)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(objgraph_version=objgraph.__version__,
+                           python=sys.version,
+                           platform=platform.platform(),
+                           results=results), f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -25,18 +25,34 @@ Released under the MIT licence.
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import array
+import bisect
 import codecs
 import collections
+import contextlib
+import functools
 import gc
 import inspect
 import itertools
+import json
+import math
 import operator
 import os
 import re
+import reprlib
+import select
+import signal
+import socket
+import struct
 import subprocess
 import sys
 import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
 import types
+import weakref
 from io import StringIO
 
 __author__ = "Marius Gedminas (marius@gedmin.as)"
@@ -115,7 +131,8 @@ def count(typename, objects=None):
         del objects  # clear cyclic references to frame
 
 
-def typestats(objects=None, shortnames=True, filter=None):
+def typestats(objects=None, shortnames=True, filter=None, counted_only=False,
+              threads=None):
     """Count the number of instances for each type tracked by the GC.
 
     Note that the GC does not track simple objects like int or str.
@@ -127,6 +144,19 @@ def typestats(objects=None, shortnames=True, filter=None):
     returning a boolean. Objects for which ``filter(obj)`` returns ``False``
     will be ignored.
 
+    If ``counted_only`` is True, returns the live instance counts maintained
+    for classes decorated with :func:`count_instances` (see
+    :func:`instance_counts`) instead of looking at every object in memory.
+    This is much faster, but cannot be combined with ``objects`` or
+    ``filter``.
+
+    On free-threaded builds of Python (with the GIL disabled), the objects
+    are split between ``threads`` threads that count them in parallel.
+    By default one thread per CPU is used for large heaps; pass
+    ``threads=1`` to count in the calling thread.  ``filter`` may then be
+    called from several threads at once.  ``threads`` is ignored when the
+    GIL is enabled.
+
     Example:
 
         >>> typestats()
@@ -145,7 +175,15 @@ def typestats(objects=None, shortnames=True, filter=None):
     .. versionchanged:: 3.1.3
        New parameter: ``filter``.
 
+    .. versionchanged:: 3.7.0
+       New parameters: ``counted_only``, ``threads``.
+
     """
+    if counted_only:
+        if objects is not None or filter is not None:
+            raise ValueError('Cannot specify objects or filter'
+                             ' with counted_only.')
+        return instance_counts(shortnames)
     if objects is None:
         objects = gc.get_objects()
     try:
@@ -153,6 +191,15 @@ def typestats(objects=None, shortnames=True, filter=None):
             typename = _short_typename
         else:
             typename = _long_typename
+        if _isinstance(objects, list) and not _gil_enabled():
+            if threads is None:
+                if len(objects) >= _PARALLEL_TYPESTATS_MIN:
+                    threads = os.cpu_count() or 1
+                else:
+                    threads = 1
+            if threads > 1:
+                return _parallel_typestats(objects, typename, filter,
+                                           threads)
         stats = {}
         for o in objects:
             if filter and not filter(o):
@@ -164,6 +211,144 @@ def typestats(objects=None, shortnames=True, filter=None):
         del objects  # clear cyclic references to frame
 
 
+def untracked_typestats(objects=None, shortnames=True, filter=None):
+    """Count objects not tracked by the GC, and their sizes, for each type.
+
+    :func:`typestats` only sees the objects tracked by the garbage
+    collector, which excludes strings, bytes, numbers, and other objects
+    that cannot refer to other objects.  This function looks at everything
+    the tracked objects refer to (and everything untracked containers
+    refer to) and counts the untracked objects it finds, each one once.
+
+    Returns a dictionary mapping type names to ``(count, size)`` tuples,
+    where ``size`` is the total size in bytes as reported by
+    :func:`sys.getsizeof`.
+
+    If ``objects`` is specified, only the untracked objects reachable from
+    them without going through other tracked objects are counted.  Objects
+    referred to only from C code (not by any object tracked by the GC) are
+    not found.
+
+    If ``filter`` is specified, it should be a function taking one argument and
+    returning a boolean. Objects for which ``filter(obj)`` returns ``False``
+    will not be counted (but objects they refer to will be).
+
+    Example:
+
+        >>> untracked_typestats()
+        {'str': (61305, 5391648), 'int': (3094, 87296), ...}
+
+    .. versionadded:: 3.7.0
+    """
+    if objects is None:
+        objects = gc.get_objects()
+    if shortnames:
+        typename = _short_typename
+    else:
+        typename = _long_typename
+    seen = set()
+    stats = {}
+    stack = []
+    try:
+        for o in objects:
+            stack.extend(_referents(o))
+            if _isinstance(o, dict):
+                # Dicts with only string keys don't report them as referents.
+                stack.extend(o)
+            while stack:
+                r = stack.pop()
+                if gc.is_tracked(r) or id(r) in seen:
+                    continue
+                seen.add(id(r))
+                stack.extend(_referents(r))
+                if _isinstance(r, dict):
+                    stack.extend(r)
+                if filter and not filter(r):
+                    continue
+                n = typename(r)
+                count, size = stats.get(n, (0, 0))
+                stats[n] = (count + 1, size + sys.getsizeof(r, 0))
+    finally:
+        del objects  # clear cyclic references to frame
+    return stats
+
+
+def count_instances(cls):
+    """Class decorator that maintains a live count of instances.
+
+    Wraps the ``__init__`` method of the class so that every new instance
+    (including instances of subclasses) is counted, and attaches a weak
+    reference callback that decrements the count when the instance is
+    freed.  Use :func:`instance_counts` to see the counts, or pass
+    ``counted_only=True`` to :func:`typestats`, :func:`growth` or
+    :func:`show_growth`.  Looking at the counts does not scan the heap, so
+    it can be done every second.
+
+    Instances are counted when ``__init__`` of the decorated class runs, so
+    subclasses that override ``__init__`` must call the inherited one.  The
+    class must support weak references (i.e. not define ``__slots__``
+    without ``__weakref__``), otherwise TypeError is raised.
+
+    Example:
+
+        >>> @count_instances
+        ... class Session(object):
+        ...     pass
+        >>> s = Session()
+        >>> instance_counts()
+        {'Session': 1}
+
+    .. versionadded:: 3.7.0
+    """
+    if not cls.__weakrefoffset__:
+        raise TypeError('cannot count instances of %s: it does not support'
+                        ' weak references' % cls.__name__)
+    original_init = cls.__init__
+
+    @functools.wraps(original_init)
+    def __init__(self, *args, **kw):
+        if id(self) not in _counted:
+            objtype = type(self)
+            ref = _CountedRef(self, _counted_instance_died)
+            with _instance_counts_lock:
+                if id(self) not in _counted:
+                    _counted[id(self)] = ref
+                    _instance_counts[objtype] = (
+                        _instance_counts.get(objtype, 0) + 1)
+        if original_init is not object.__init__:
+            original_init(self, *args, **kw)
+        elif (args or kw) and type(self).__new__ is object.__new__:
+            # object.__init__() would complain about any arguments now
+            # that __init__ is overridden, even if __new__ accepts them;
+            # only complain when object.__new__() would have.
+            raise TypeError('%s() takes no arguments' % type(self).__name__)
+
+    cls.__init__ = __init__
+    return cls
+
+
+def instance_counts(shortnames=True):
+    """Count live instances of classes decorated with :func:`count_instances`.
+
+    Returns a dictionary mapping type names to numbers of live instances.
+
+    Note that classes with the same name but defined in different modules
+    will be lumped together if ``shortnames`` is True.
+
+    .. versionadded:: 3.7.0
+    """
+    stats = {}
+    with _instance_counts_lock:
+        counts = list(_instance_counts.items())
+    for objtype, n in counts:
+        if shortnames:
+            name = objtype.__name__
+        else:
+            name = _long_typename_of_type(objtype)
+        stats[name] = stats.get(name, 0) + n
+    return stats
+
+
 def most_common_types(limit=10, objects=None, shortnames=True, filter=None):
     """Count the names of types with the most instances.
 
@@ -250,7 +435,200 @@ def show_most_common_types(
         file.write('%-*s %i\n' % (width, name, count))
 
 
-def growth(limit=10, peak_stats={}, shortnames=True, filter=None):
+def module_stats(objects=None, filter=None):
+    """Count objects and their sizes for each module and package.
+
+    Each object is attributed to the module that defines its type (i.e. the
+    ``__module__`` attribute of the type), and then the counts are added up
+    the dotted module hierarchy, so the numbers for a package include
+    everything defined in its subpackages and submodules.
+
+    Returns a dictionary mapping module and package names to
+    ``(count, size)`` tuples, where ``size`` is the total size in bytes as
+    reported by :func:`sys.getsizeof`.  Types without a ``__module__`` are
+    counted under ``'?'``.
+
+    If ``filter`` is specified, it should be a function taking one argument and
+    returning a boolean. Objects for which ``filter(obj)`` returns ``False``
+    will be ignored.
+
+    The caveats documented in :func:`typestats` apply.
+
+    Example:
+
+        >>> module_stats()
+        {'builtins': (48309, 6193180), 'mypackage': (5304, 862304),
+         'mypackage.models': (5208, 853744), ...}
+
+    .. versionadded:: 3.7.0
+    """
+    if objects is None:
+        objects = gc.get_objects()
+    try:
+        counts, sizes = _typestats_and_sizes(objects, type, filter)
+    finally:
+        del objects  # clear cyclic references to frame
+    stats = {}
+    for objtype, count in counts.items():
+        module = getattr(objtype, '__module__', None)
+        if not _isinstance(module, str) or not module:
+            module = '?'
+        size = sizes[objtype]
+        parts = module.split('.')
+        for n in range(1, len(parts) + 1):
+            name = '.'.join(parts[:n])
+            old_count, old_size = stats.get(name, (0, 0))
+            stats[name] = (old_count + count, old_size + size)
+    return stats
+
+
+def show_module_stats(max_depth=None, objects=None, filter=None, file=None):
+    """Print a tree of object counts and sizes by module and package.
+
+    Each row shows the total number of objects whose types are defined in a
+    module or package (including its submodules), and their total size in
+    bytes.  Packages are followed by their submodules, indented, the largest
+    first.
+
+    Use ``max_depth`` to limit how many levels of the hierarchy are shown.
+
+    The caveats documented in :func:`module_stats` apply.
+
+    Example:
+
+        >>> show_module_stats(max_depth=2)
+        builtins                 48309  6193180
+        mypackage                 5304   862304
+          mypackage.models        5208   853744
+          mypackage.views           96     8560
+        ...
+
+    .. versionadded:: 3.7.0
+    """
+    if file is None:
+        file = sys.stdout
+    stats = module_stats(objects, filter=filter)
+    children = collections.defaultdict(list)
+    for name in stats:
+        children[name.rpartition('.')[0]].append(name)
+    rows = []
+    todo = [('', -1)]
+    while todo:
+        name, level = todo.pop()
+        if name:
+            rows.append(('  ' * level + name, stats[name]))
+        if max_depth is None or level + 1 < max_depth:
+            todo.extend((child, level + 1) for child in sorted(
+                children[name], key=lambda child: stats[child][1]))
+    if not rows:
+        return
+    width = max(len(name) for name, _ in rows)
+    for name, (count, size) in rows:
+        file.write('%-*s %8d %12d\n' % (width, name, count, size))
+
+
+def thread_stats(shortnames=True):
+    """Find out which objects are kept alive only by each thread's stack.
+
+    Marks everything that can be reached from ``sys.modules``, and then, for
+    each running thread, everything that can be reached from the local
+    variables of the frames on its stack.  Objects reachable from the stack
+    of exactly one thread and not from any module are attributed to that
+    thread.
+
+    Returns a dictionary mapping thread identifiers (see
+    :func:`threading.get_ident`) to lists of ``(type_name, count, size)``
+    tuples, sorted by ``size``, largest first, where ``size`` is the total
+    size in bytes as reported by :func:`sys.getsizeof`.
+
+    Unlike most other functions in this module, this one also counts the
+    objects that the garbage collector does not track, such as strings and
+    numbers.  Temporary values on the frames' evaluation stacks are not
+    seen.
+
+    Example:
+
+        >>> thread_stats()
+        {140093487261504: [('list', 2, 80056), ('str', 1, 1000049), ...],
+         140093470476032: [('Session', 1, 56), ...]}
+
+    .. versionadded:: 3.7.0
+    """
+    if shortnames:
+        typename = _short_typename
+    else:
+        typename = _long_typename
+    frames = sys._current_frames()
+    frames[threading.get_ident()] = sys._getframe(1)
+    shared = set()
+    _mark_reachable([sys.modules], shared)
+    owner = {}
+    found = {}
+    for ident, frame in frames.items():
+        roots = []
+        while frame is not None:
+            roots.extend(frame.f_locals.values())
+            frame = frame.f_back
+        seen = set()
+        _mark_reachable(roots, seen, found, stop=shared)
+        del roots
+        for id_number in seen:
+            owner[id_number] = None if id_number in owner else ident
+    del frames, frame, seen
+    stats = collections.defaultdict(dict)
+    for id_number, ident in owner.items():
+        if ident is None:
+            continue
+        o = found[id_number]
+        n = typename(o)
+        count, size = stats[ident].get(n, (0, 0))
+        stats[ident][n] = (count + 1, size + sys.getsizeof(o, 0))
+    o = found = None
+    return {ident: sorted(((n, count, size)
+                           for n, (count, size) in thread.items()),
+                          key=operator.itemgetter(2), reverse=True)
+            for ident, thread in stats.items()}
+
+
+def show_thread_stats(limit=5, shortnames=True, file=None):
+    """Print the objects kept alive only by each thread's stack.
+
+    For each thread shows the total number and size of the objects that
+    only its stack keeps alive, followed by the ``limit`` types that take up
+    the most memory.  You may set ``limit`` to None to see all of them.
+
+    The caveats documented in :func:`thread_stats` apply.
+
+    Example:
+
+        >>> show_thread_stats(limit=2)
+        MainThread (140093487261504): 3 objects, 1080105 bytes
+          str                       1      1000049
+          list                      2        80056
+        worker-1 (140093470476032): 1 objects, 56 bytes
+          Session                   1           56
+
+    .. versionadded:: 3.7.0
+    """
+    if file is None:
+        file = sys.stdout
+    stats = thread_stats(shortnames=shortnames)
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    for ident, rows in sorted(stats.items()):
+        file.write('%s (%d): %d objects, %d bytes\n'
+                   % (names.get(ident, '?'), ident,
+                      sum(count for _, count, _ in rows),
+                      sum(size for _, _, size in rows)))
+        if limit:
+            rows = rows[:limit]
+        width = max(len(name) for name, _, _ in rows)
+        for name, count, size in rows:
+            file.write('  %-*s %8d %12d\n'
+                       % (max(width, 20), name, count, size))
+
+
+def growth(limit=10, peak_stats={}, shortnames=True, filter=None,
+           counted_only=False):
     """Count the increase in peak object since last call.
 
     Returns a list of (type_name, total_count, increase_delta),
@@ -267,6 +645,11 @@ def growth(limit=10, peak_stats={}, shortnames=True, filter=None):
     returning a boolean. Objects for which ``filter(obj)`` returns ``False``
     will be ignored.
 
+    If ``counted_only`` is True, looks only at classes decorated with
+    :func:`count_instances`.  This avoids the garbage collection and the
+    scan of all objects in memory, which makes it cheap enough to call
+    often.
+
     The caveats documented in :func:`typestats` apply.
 
     Example:
@@ -276,9 +659,14 @@ def growth(limit=10, peak_stats={}, shortnames=True, filter=None):
 
     .. versionadded:: 3.3.0
 
+    .. versionchanged:: 3.7.0
+       New parameter: ``counted_only``.
+
     """
-    gc.collect()
-    stats = typestats(shortnames=shortnames, filter=filter)
+    if not counted_only:
+        gc.collect()
+    stats = typestats(shortnames=shortnames, filter=filter,
+                      counted_only=counted_only)
     deltas = {}
     for name, count in stats.items():
         old_count = peak_stats.get(name, 0)
@@ -294,7 +682,7 @@ def growth(limit=10, peak_stats={}, shortnames=True, filter=None):
 
 
 def show_growth(limit=10, peak_stats=None, shortnames=True, file=None,
-                filter=None):
+                filter=None, counted_only=False):
     """Show the increase in peak object counts since last call.
 
     if ``peak_stats`` is None, peak object counts will recorded in
@@ -322,11 +710,15 @@ def show_growth(limit=10, peak_stats=None, shortnames=True, file=None,
     .. versionchanged:: 3.1.3
        New parameter: ``filter``.
 
+    .. versionchanged:: 3.7.0
+       New parameter: ``counted_only``.
+
     """
     if peak_stats is None:
-        result = growth(limit, shortnames=shortnames, filter=filter)
+        result = growth(limit, shortnames=shortnames, filter=filter,
+                        counted_only=counted_only)
     else:
-        result = growth(limit, peak_stats, shortnames, filter)
+        result = growth(limit, peak_stats, shortnames, filter, counted_only)
     if result:
         if file is None:
             file = sys.stdout
@@ -335,6 +727,852 @@ def show_growth(limit=10, peak_stats=None, shortnames=True, file=None,
             file.write('%-*s%9d %+9d\n' % (width, name, count, delta))
 
 
+class LeakDetector(object):
+    """Find types whose object counts keep growing.
+
+    :func:`show_growth` reports every new peak, so types whose counts go up
+    and down (caches, buffers, per-request objects) show up all the time.
+    A leak detector remembers the last ``size`` samples of object counts of
+    each type, fits a straight line to them, and reports only those types
+    whose counts never went down and grew at a statistically significant
+    rate.
+
+    The samples are kept in fixed-size ring buffers, and types that had no
+    objects for the entire window are forgotten, so the memory used does
+    not increase over time.
+
+    ``shortnames`` and ``filter`` have the same meaning as in
+    :func:`typestats`.
+
+    Example:
+
+        >>> detector = LeakDetector()
+        >>> detector.sample()       # call this periodically
+        >>> # ... some time later ...
+        >>> detector.leaks()
+        [('Session', 4120, 1.9935, 104.7)]
+
+    .. versionadded:: 3.7.0
+    """
+
+    def __init__(self, size=60, shortnames=True, filter=None):
+        if size < 3:
+            raise ValueError('size must be at least 3')
+        self.size = size
+        self.shortnames = shortnames
+        self.filter = filter
+        self.samples = 0
+        self._times = array.array('d', [0.0] * size)
+        self._counts = {}
+
+    def sample(self, stats=None):
+        """Record the current object counts.
+
+        Calls :func:`typestats` unless you pass in ``stats``, a dictionary
+        mapping type names to object counts.
+        """
+        if stats is None:
+            gc.collect()
+            stats = typestats(shortnames=self.shortnames, filter=self.filter)
+        pos = self.samples % self.size
+        self._times[pos] = time.monotonic()
+        for name, counts in list(self._counts.items()):
+            counts[pos] = stats.get(name, 0)
+            if not counts[pos] and not any(counts):
+                del self._counts[name]
+        for name, count in stats.items():
+            if name not in self._counts:
+                counts = self._counts[name] = array.array('q', [0] * self.size)
+                counts[pos] = count
+        self.samples += 1
+
+    def leaks(self, min_samples=10, min_t=3.0):
+        """Report the types that appear to be leaking.
+
+        Fits a least-squares line to each type's object counts in the window
+        and computes the t statistic of its slope (the slope divided by its
+        standard error).  A type is reported if its count never decreased,
+        increased overall, and the t statistic is at least ``min_t``.
+        Nothing is reported until at least ``min_samples`` samples have been
+        taken.
+
+        Returns a list of ``(type_name, count, slope, t)`` tuples, where
+        ``count`` is the latest object count and ``slope`` is the growth
+        rate in objects per second, fastest growing types first.
+        """
+        n = min(self.samples, self.size)
+        if n < max(min_samples, 3):
+            return []
+        start = self.samples % self.size if self.samples > self.size else 0
+        order = [(start + i) % self.size for i in range(n)]
+        xs = [self._times[i] for i in order]
+        mean_x = sum(xs) / n
+        xs = [x - mean_x for x in xs]
+        sxx = sum(x * x for x in xs)
+        if not sxx:
+            return []
+        result = []
+        for name, counts in self._counts.items():
+            ys = [counts[i] for i in order]
+            if ys[-1] <= ys[0]:
+                continue
+            if any(b < a for a, b in zip(ys, ys[1:])):
+                continue
+            mean_y = sum(ys) / n
+            sxy = sum(x * (y - mean_y) for x, y in zip(xs, ys))
+            syy = sum((y - mean_y) ** 2 for y in ys)
+            slope = sxy / sxx
+            sse = max(syy - slope * sxy, 0.0)
+            stderr = (sse / (n - 2) / sxx) ** 0.5
+            t = slope / stderr if stderr else float('inf')
+            if t >= min_t:
+                result.append((name, ys[-1], slope, t))
+        result.sort(key=operator.itemgetter(2), reverse=True)
+        return result
+
+
+class TypeCountLog(object):
+    """Record object counts and sizes over time in a compact file.
+
+    Each call to :meth:`append` adds a sample of the number and total size
+    of objects of every type to the file at ``path``, creating it if
+    necessary.  Samples only store the types whose counts changed since the
+    previous sample, as variable-length integer deltas, so thousands of
+    samples of hundreds of types take a few megabytes.  The file is only
+    ever appended to.
+
+    The samples are also kept in memory (including those that were already
+    in the file when it was opened), and you can query them with
+    :meth:`series` and :meth:`growth` instead of parsing saved
+    :func:`show_growth` output.
+
+    ``shortnames`` and ``filter`` have the same meaning as in
+    :func:`typestats`.
+
+    Example:
+
+        >>> log = TypeCountLog('/var/log/myapp/objgraph.log')
+        >>> log.append()            # call this periodically
+        >>> # ... some time later ...
+        >>> log.growth(time.time() - 3600, limit=2)
+        [('Session', 4120, 3700), ('dict', 24519, 3712)]
+        >>> log.series('Session', time.time() - 300)
+        [(1700000000.25, 4001, 224056), (1700000060.25, 4120, 230720)]
+        >>> log.close()
+
+    .. versionadded:: 3.7.0
+    """
+
+    _magic = b'objgraph-typecounts 1\n'
+
+    def __init__(self, path, shortnames=True, filter=None):
+        self.path = path
+        self.shortnames = shortnames
+        self.filter = filter
+        self.times = array.array('d')
+        self._names = []
+        self._index = {}
+        # For each type, the sample numbers where its count or size changed,
+        # and the count and size from then on.
+        self._changes = []
+        self._last = []
+        self._file = open(path, 'ab+')
+        self._file.seek(0)
+        data = self._file.read()
+        try:
+            if not data:
+                self._file.write(self._magic)
+                self._file.flush()
+            elif not data.startswith(self._magic):
+                raise ValueError('%s is not an objgraph type count log'
+                                 % path)
+            else:
+                end = self._load(data, len(self._magic))
+                if end < len(data):
+                    # The last record was not written completely.
+                    self._file.truncate(end)
+        except Exception:
+            self._file.close()
+            raise
+
+    def _load(self, data, pos):
+        end = pos
+        try:
+            while pos < len(data):
+                tag = data[pos:pos + 1]
+                pos += 1
+                if tag == b'T':
+                    length, pos = _decode_varint(data, pos)
+                    if pos + length > len(data):
+                        break
+                    self._add_type(data[pos:pos + length].decode('utf-8'))
+                    pos += length
+                elif tag == b'S':
+                    timestamp, = struct.unpack_from('<d', data, pos)
+                    pos += 8
+                    n, pos = _decode_varint(data, pos)
+                    changed = []
+                    for i in range(n):
+                        index, pos = _decode_varint(data, pos)
+                        if index >= len(self._names):
+                            raise ValueError('%s is corrupted at offset %d'
+                                             % (self.path, end))
+                        count, pos = _decode_varint(data, pos)
+                        size, pos = _decode_varint(data, pos)
+                        changed.append((index, _unzigzag(count),
+                                        _unzigzag(size)))
+                    self._add_sample(timestamp, changed)
+                else:
+                    raise ValueError('%s is corrupted at offset %d'
+                                     % (self.path, pos - 1))
+                end = pos
+        except (IndexError, struct.error):
+            pass
+        return end
+
+    def _add_type(self, name):
+        self._index[name] = len(self._names)
+        self._names.append(name)
+        self._changes.append((array.array('l'), array.array('q'),
+                              array.array('q')))
+        self._last.append((0, 0))
+
+    def _add_sample(self, timestamp, changed):
+        sample = len(self.times)
+        self.times.append(timestamp)
+        for index, count_delta, size_delta in changed:
+            count, size = self._last[index]
+            count += count_delta
+            size += size_delta
+            self._last[index] = count, size
+            samples, counts, sizes = self._changes[index]
+            samples.append(sample)
+            counts.append(count)
+            sizes.append(size)
+
+    def append(self, stats=None, timestamp=None):
+        """Add a sample to the log.
+
+        Counts the objects tracked by the garbage collector unless you pass
+        in ``stats``, a dictionary mapping type names to ``(count,
+        total_size)`` tuples.  ``timestamp`` defaults to ``time.time()``.
+        """
+        if stats is None:
+            if self.shortnames:
+                typename = _short_typename
+            else:
+                typename = _long_typename
+            gc.collect()
+            counts, sizes = _typestats_and_sizes(gc.get_objects(), typename,
+                                                 self.filter)
+            stats = {name: (count, sizes[name])
+                     for name, count in counts.items()}
+        if timestamp is None:
+            timestamp = time.time()
+        # Build the whole record before changing anything, so that bad
+        # stats don't leave types in memory that are not in the file.
+        record = bytearray()
+        new_names = [name for name in stats if name not in self._index]
+        for name in new_names:
+            encoded = name.encode('utf-8')
+            record += b'T'
+            _encode_varint(record, len(encoded))
+            record += encoded
+        changed = []
+        for index, name in enumerate(self._names + new_names):
+            count, size = stats.get(name, (0, 0))
+            if index < len(self._last):
+                old_count, old_size = self._last[index]
+            else:
+                old_count = old_size = 0
+            if count != old_count or size != old_size:
+                changed.append((index, count - old_count, size - old_size))
+        record += b'S'
+        record += struct.pack('<d', timestamp)
+        _encode_varint(record, len(changed))
+        for index, count_delta, size_delta in changed:
+            _encode_varint(record, index)
+            _encode_varint(record, _zigzag(count_delta))
+            _encode_varint(record, _zigzag(size_delta))
+        self._file.write(record)
+        self._file.flush()
+        for name in new_names:
+            self._add_type(name)
+        self._add_sample(timestamp, changed)
+
+    def _samples(self, t1, t2):
+        start = 0 if t1 is None else bisect.bisect_left(self.times, t1)
+        stop = (len(self.times) if t2 is None
+                else bisect.bisect_right(self.times, t2))
+        return range(start, stop)
+
+    def _at(self, index, sample):
+        samples, counts, sizes = self._changes[index]
+        i = bisect.bisect_right(samples, sample) - 1
+        if i < 0:
+            return 0, 0
+        return counts[i], sizes[i]
+
+    def series(self, typename, t1=None, t2=None):
+        """Return the samples of one type between ``t1`` and ``t2``.
+
+        Returns a list of ``(timestamp, count, total_size)`` tuples for all
+        samples taken between ``t1`` and ``t2`` (inclusive).  Either of
+        them may be None, meaning the beginning or the end of the log.
+        """
+        index = self._index.get(typename)
+        result = []
+        for sample in self._samples(t1, t2):
+            if index is None:
+                count, size = 0, 0
+            else:
+                count, size = self._at(index, sample)
+            result.append((self.times[sample], count, size))
+        return result
+
+    def growth(self, t1=None, t2=None, limit=10):
+        """Find the types that grew the most between ``t1`` and ``t2``.
+
+        Compares the first and the last sample taken between ``t1`` and
+        ``t2`` (inclusive; None means the beginning or the end of the log).
+
+        Returns a list of ``(type_name, count, increase_delta)`` tuples like
+        :func:`growth`, where ``count`` is the count in the last sample,
+        sorted by ``increase_delta``, largest first.  Limits the output to
+        ``limit`` largest deltas; you may set ``limit`` to None to see all
+        of them.
+        """
+        samples = self._samples(t1, t2)
+        if not samples:
+            return []
+        first, last = samples[0], samples[-1]
+        result = []
+        for index, name in enumerate(self._names):
+            old_count = self._at(index, first)[0]
+            count = self._at(index, last)[0]
+            if count > old_count:
+                result.append((name, count, count - old_count))
+        result.sort(key=operator.itemgetter(2), reverse=True)
+        if limit:
+            result = result[:limit]
+        return result
+
+    def close(self):
+        """Close the file."""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Snapshot(object):
+    """A compact record of the objects tracked by the GC.
+
+    Walks the objects in ``objects`` (by default all the objects tracked by
+    the garbage collector) once and records their IDs, types, sizes and the
+    references between them in flat arrays.  The objects themselves are not
+    kept alive, so you can take a snapshot, let the program run, and analyse
+    it later, or compare it with another snapshot.
+
+    If NumPy is installed, the arrays are NumPy arrays and the analysis
+    methods are vectorized, which makes them much faster for heaps with
+    millions of objects.  Otherwise, or if ``use_numpy`` is False, the
+    snapshot uses the :mod:`array` module and plain Python loops.
+
+    ``shortnames`` has the same meaning as in :func:`typestats`.
+
+    Raises ImportError if ``use_numpy`` is True and NumPy is not installed.
+
+    Example:
+
+        >>> before = Snapshot()
+        >>> # ... some time later ...
+        >>> after = Snapshot()
+        >>> after.typestats()
+        {'dict': 4312, 'function': 12041, ...}
+        >>> new_ids = after.new_ids(before)
+        >>> len(new_ids['dict'])
+        17
+
+    .. versionadded:: 3.7.0
+    """
+
+    def __init__(self, objects=None, shortnames=True, use_numpy=None):
+        # NumPy takes a while to import, so only do it when it is needed.
+        if use_numpy is None:
+            try:
+                import numpy
+            except ImportError:
+                use_numpy = False
+            else:
+                use_numpy = True
+        elif use_numpy:
+            import numpy
+        self.use_numpy = use_numpy
+        if shortnames:
+            typename = _short_typename
+        else:
+            typename = _long_typename
+        if objects is None:
+            gc.collect()
+            objects = gc.get_objects()
+        #: Type names; :attr:`types` holds indexes into this list.
+        self.type_names = []
+        type_codes = {}
+        ids = array.array('Q')
+        codes = array.array('q')
+        sizes = array.array('q')
+        # References in compressed sparse row format: the objects referred
+        # to by the i-th object are indices[indptr[i]:indptr[i + 1]].
+        indptr = array.array('q', [0])
+        indices = array.array('q')
+        try:
+            index = {id(o): i for i, o in enumerate(objects)}
+            for o in objects:
+                ids.append(id(o))
+                name = typename(o)
+                code = type_codes.get(name)
+                if code is None:
+                    code = type_codes[name] = len(self.type_names)
+                    self.type_names.append(name)
+                codes.append(code)
+                sizes.append(sys.getsizeof(o, 0))
+                for r in gc.get_referents(o):
+                    i = index.get(id(r))
+                    if i is not None:
+                        indices.append(i)
+                indptr.append(len(indices))
+        finally:
+            del objects  # clear cyclic references to frame
+        del index
+        if use_numpy:
+            ids = numpy.frombuffer(ids, dtype=numpy.uint64)
+            codes = numpy.frombuffer(codes, dtype=numpy.int64)
+            sizes = numpy.frombuffer(sizes, dtype=numpy.int64)
+            indptr = numpy.frombuffer(indptr, dtype=numpy.int64)
+            indices = numpy.frombuffer(indices, dtype=numpy.int64)
+        self.ids = ids
+        self.types = codes
+        self.sizes = sizes
+        self.indptr = indptr
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _by_type(self, weights=None):
+        if self.use_numpy:
+            import numpy
+            totals = numpy.bincount(self.types, weights,
+                                    minlength=len(self.type_names))
+            totals = totals.astype(numpy.int64).tolist()
+        else:
+            totals = [0] * len(self.type_names)
+            if weights is None:
+                for code in self.types:
+                    totals[code] += 1
+            else:
+                for code, weight in zip(self.types, weights):
+                    totals[code] += weight
+        return dict(zip(self.type_names, totals))
+
+    def typestats(self):
+        """Count the objects of each type.
+
+        Returns a dictionary mapping type names to object counts, like
+        :func:`typestats`.
+        """
+        return self._by_type()
+
+    def type_sizes(self):
+        """Add up the sizes of the objects of each type.
+
+        Returns a dictionary mapping type names to total sizes in bytes, as
+        reported by :func:`sys.getsizeof`.
+        """
+        return self._by_type(self.sizes)
+
+    def in_degrees(self):
+        """Count the references to each object from the other objects.
+
+        Returns an array with one number for each object in the snapshot,
+        in the same order as :attr:`ids`.
+        """
+        if self.use_numpy:
+            import numpy
+            return numpy.bincount(self.indices, minlength=len(self.ids))
+        result = array.array('q', [0] * len(self.ids))
+        for i in self.indices:
+            result[i] += 1
+        return result
+
+    def leaking_ids(self):
+        """Return the IDs of objects that no other object refers to.
+
+        This is what :func:`get_leaking_objects` looks for, see its
+        documentation for what it means.
+        """
+        if self.use_numpy:
+            return self.ids[self.in_degrees() == 0].tolist()
+        return [id_number for id_number, n in zip(self.ids, self.in_degrees())
+                if not n]
+
+    def new_ids(self, older):
+        """Find the objects that are not in an ``older`` snapshot.
+
+        Returns a dictionary mapping type names to sets of object IDs, like
+        :func:`get_new_ids`.
+
+        Note that objects that were freed in between the two snapshots may
+        have had their IDs reused by new objects, which will then not be
+        seen as new.
+        """
+        if self.use_numpy:
+            import numpy
+            new = numpy.flatnonzero(
+                numpy.isin(self.ids, numpy.asarray(older.ids), invert=True))
+            pairs = zip(self.types[new].tolist(), self.ids[new].tolist())
+        else:
+            old_ids = set(older.ids)
+            pairs = ((code, id_number)
+                     for code, id_number in zip(self.types, self.ids)
+                     if id_number not in old_ids)
+        result = collections.defaultdict(set)
+        for code, id_number in pairs:
+            result[self.type_names[code]].add(id_number)
+        return dict(result)
+
+    def reachable_ids(self, ids):
+        """Find the objects reachable from the objects with the given IDs.
+
+        Returns a set of object IDs, including the ones from ``ids`` that
+        are in the snapshot.
+        """
+        if self.use_numpy:
+            return self._numpy_reachable_ids(ids)
+        wanted = set(ids)
+        visited = bytearray(len(self.ids))
+        stack = [i for i, id_number in enumerate(self.ids)
+                 if id_number in wanted]
+        for i in stack:
+            visited[i] = 1
+        indptr, indices = self.indptr, self.indices
+        while stack:
+            i = stack.pop()
+            for j in indices[indptr[i]:indptr[i + 1]]:
+                if not visited[j]:
+                    visited[j] = 1
+                    stack.append(j)
+        return {id_number for id_number, v in zip(self.ids, visited) if v}
+
+    def _numpy_reachable_ids(self, ids):
+        import numpy
+        visited = numpy.zeros(len(self.ids), dtype=bool)
+        frontier = numpy.flatnonzero(
+            numpy.isin(self.ids, numpy.fromiter(ids, dtype=numpy.uint64)))
+        visited[frontier] = True
+        while frontier.size:
+            starts = self.indptr[frontier]
+            lengths = self.indptr[frontier + 1] - starts
+            ends = numpy.cumsum(lengths)
+            # Positions of all the references from the frontier objects.
+            positions = (numpy.repeat(starts - ends + lengths, lengths)
+                         + numpy.arange(ends[-1]))
+            targets = self.indices[positions]
+            frontier = numpy.unique(targets[~visited[targets]])
+            visited[frontier] = True
+        return set(self.ids[visited].tolist())
+
+
+def publish_typestats(address, stats=None, worker=None, shortnames=True,
+                      timeout=1.0):
+    """Send object counts to a :class:`TypestatsCollector`.
+
+    Connects to the collector listening on the Unix socket ``address`` and
+    sends it ``stats``, a dictionary mapping type names to numbers.  If
+    ``stats`` is not specified, sends the result of
+    :func:`typestats(shortnames=shortnames) <typestats>`.  You can also send
+    growth deltas, e.g.
+    ``{name: delta for name, count, delta in growth(limit=None)}``.
+
+    ``worker`` identifies the sender and defaults to the process ID.  A new
+    report from the same worker replaces the previous one.
+
+    Large reports don't fit in the socket buffer, so they can only be sent
+    while the collector is in :meth:`TypestatsCollector.receive`.  To keep
+    a busy worker from waiting for the collector, sending gives up after
+    ``timeout`` seconds and raises :exc:`socket.timeout` (you may set
+    ``timeout`` to None to wait indefinitely).
+
+    Example:
+
+        >>> publish_typestats('/run/myapp/objgraph.sock')
+
+    .. versionadded:: 3.7.0
+    """
+    if stats is None:
+        stats = typestats(shortnames=shortnames)
+    if worker is None:
+        worker = os.getpid()
+    message = json.dumps({'worker': worker, 'stats': stats})
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.sendall(message.encode('utf-8'))
+
+
+class TypestatsCollector(object):
+    """Collect object counts from several processes on the same host.
+
+    Pre-forking servers run many worker processes, and
+    :func:`show_most_common_types` only sees the one it is called in.
+    A collector listens on a Unix socket at ``address``; each worker
+    periodically calls :func:`publish_typestats`, and the collector merges
+    the reports into host-wide totals and points out the workers whose
+    counts stand out.
+
+    The collector does not start any threads: call :meth:`receive`
+    whenever you want to process the reports that have arrived.  Reports
+    that take longer than ``read_timeout`` seconds to arrive, or that
+    cannot be parsed (e.g. because the worker died while sending them),
+    are skipped.
+
+    Workers that exit stop sending reports, but their last reports are
+    kept until you call :meth:`forget`.  If ``max_age`` is not None,
+    :meth:`receive` also drops the reports of the workers that haven't
+    sent one for ``max_age`` seconds, which is handy with servers that
+    replace their workers from time to time.
+
+    Example:
+
+        >>> collector = TypestatsCollector('/run/myapp/objgraph.sock')
+        >>> # ... every worker calls publish_typestats() ...
+        >>> collector.receive(timeout=5)
+        32
+        >>> sorted(collector.merged().items(), key=lambda x: -x[1])[:2]
+        [('dict', 1604352), ('function', 1181792)]
+        >>> collector.outliers()
+        [(4242, 'Session', 41200, 12.0)]
+        >>> collector.close()
+
+    .. versionadded:: 3.7.0
+    """
+
+    def __init__(self, address, read_timeout=1.0, max_age=None):
+        self.address = address
+        self.read_timeout = read_timeout
+        self.max_age = max_age
+        self.stats = {}
+        # Worker -> time.monotonic() of its last report
+        self.received_at = {}
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(address)
+        self._sock.listen(socket.SOMAXCONN)
+
+    def receive(self, timeout=0):
+        """Process the reports that have arrived.
+
+        Waits up to ``timeout`` seconds for the first report (you may set
+        ``timeout`` to None to wait indefinitely), then processes all the
+        reports that are already waiting, and forgets the workers whose
+        last report is older than ``max_age``.
+
+        Returns the number of reports processed.
+        """
+        received = 0
+        while select.select([self._sock], [], [], timeout)[0]:
+            timeout = 0
+            conn, _ = self._sock.accept()
+            try:
+                with conn:
+                    conn.settimeout(self.read_timeout)
+                    chunks = []
+                    while True:
+                        chunk = conn.recv(65536)
+                        if not chunk:
+                            break
+                        chunks.append(chunk)
+                report = json.loads(b''.join(chunks).decode('utf-8'))
+                self.stats[report['worker']] = report['stats']
+            except (socket.timeout, ValueError, KeyError, TypeError):
+                continue
+            self.received_at[report['worker']] = time.monotonic()
+            received += 1
+        if self.max_age is not None:
+            now = time.monotonic()
+            for worker, when in list(self.received_at.items()):
+                if now - when > self.max_age:
+                    self.forget(worker)
+        return received
+
+    def forget(self, worker):
+        """Drop the last report of ``worker``, e.g. because it has exited."""
+        self.stats.pop(worker, None)
+        self.received_at.pop(worker, None)
+
+    def merged(self):
+        """Return a dictionary of type names to counts summed over workers."""
+        total = collections.Counter()
+        for stats in self.stats.values():
+            total.update(stats)
+        return dict(total)
+
+    def outliers(self, factor=2.0, min_excess=1000):
+        """Find workers that have many more objects of some type than others.
+
+        Compares each worker's count for each type with the median count of
+        all the workers, and reports it if it exceeds ``factor`` times the
+        median and the difference is at least ``min_excess``.
+
+        Returns a list of ``(worker, type_name, count, median)`` tuples,
+        sorted by the difference between ``count`` and ``median``, largest
+        first.
+        """
+        result = []
+        names = set()
+        for stats in self.stats.values():
+            names.update(stats)
+        for name in names:
+            counts = sorted(stats.get(name, 0)
+                            for stats in self.stats.values())
+            middle = len(counts) // 2
+            if len(counts) % 2:
+                median = counts[middle]
+            else:
+                median = (counts[middle - 1] + counts[middle]) / 2.0
+            for worker, stats in self.stats.items():
+                count = stats.get(name, 0)
+                if count > median * factor and count - median >= min_excess:
+                    result.append((worker, name, count, median))
+        result.sort(key=lambda row: row[2] - row[3], reverse=True)
+        return result
+
+    def close(self):
+        """Stop listening and remove the socket."""
+        self._sock.close()
+        os.unlink(self.address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def prometheus_metrics(limit=None, shortnames=True, filter=None):
+    """Return per-type object counts in the Prometheus text format.
+
+    Produces two metrics: ``objgraph_objects`` with the number of objects of
+    each type, and ``objgraph_object_bytes`` with their total size as
+    reported by :func:`sys.getsizeof` (which does not include the size of
+    referenced objects).
+
+    ``limit``, ``shortnames`` and ``filter`` have the same meaning as for
+    :func:`most_common_types`; use ``limit`` to keep the number of distinct
+    label values under control.
+
+    The caveats documented in :func:`typestats` apply.
+
+    Example:
+
+        >>> print(prometheus_metrics(limit=1))
+        # HELP objgraph_objects Number of objects tracked by the GC.
+        # TYPE objgraph_objects gauge
+        objgraph_objects{type="function"} 12041
+        # HELP objgraph_object_bytes Total size of objects tracked by the GC.
+        # TYPE objgraph_object_bytes gauge
+        objgraph_object_bytes{type="function"} 1734096
+
+    .. versionadded:: 3.7.0
+    """
+    if shortnames:
+        typename = _short_typename
+    else:
+        typename = _long_typename
+    counts, sizes = _typestats_and_sizes(gc.get_objects(), typename, filter)
+    stats = sorted(counts.items(), key=operator.itemgetter(1), reverse=True)
+    if limit:
+        stats = stats[:limit]
+    lines = ['# HELP objgraph_objects Number of objects tracked by the GC.',
+             '# TYPE objgraph_objects gauge']
+    for name, count in stats:
+        lines.append('objgraph_objects{type="%s"} %d'
+                     % (_prometheus_quote(name), count))
+    lines += ['# HELP objgraph_object_bytes'
+              ' Total size of objects tracked by the GC.',
+              '# TYPE objgraph_object_bytes gauge']
+    for name, count in stats:
+        lines.append('objgraph_object_bytes{type="%s"} %d'
+                     % (_prometheus_quote(name), sizes[name]))
+    return '\n'.join(lines) + '\n'
+
+
+def _prometheus_quote(s):
+    """Escape a label value for the Prometheus text format."""
+    return (s.replace('\\', '\\\\')
+             .replace('"', '\\"')
+             .replace('\n', '\\n'))
+
+
+def start_metrics_server(port, addr='127.0.0.1', ttl=60, limit=None,
+                         shortnames=True, filter=None):
+    """Serve :func:`prometheus_metrics` over HTTP from a background thread.
+
+    Starts a daemon thread running an HTTP server on ``addr``:``port``.  The
+    metrics are computed on the first request and then cached for ``ttl``
+    seconds, so frequent scrapes do not walk the whole heap every time.
+
+    ``limit``, ``shortnames`` and ``filter`` are passed to
+    :func:`prometheus_metrics`.
+
+    Returns the server object; call its ``shutdown()`` method to stop
+    serving.  Pass ``port=0`` to pick a free port, and then look at
+    ``server.server_address`` to see which one was picked.
+
+    Example:
+
+        >>> server = start_metrics_server(9105, limit=100)
+
+    .. versionadded:: 3.7.0
+    """
+    import http.server
+
+    cache = []
+    lock = threading.Lock()
+
+    def get_metrics():
+        with lock:
+            now = time.monotonic()
+            if not cache or now - cache[0] > ttl:
+                cache[:] = [now, prometheus_metrics(limit, shortnames,
+                                                    filter).encode('utf-8')]
+            return cache[1]
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            body = get_metrics()
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((addr, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever,
+                              name='objgraph-metrics', daemon=True)
+    thread.start()
+    return server
+
+
 def get_new_ids(skip_update=False, limit=10, sortby='deltas',
                 shortnames=None, file=None, _state={}):
     """Find and display new objects allocated since last call.
@@ -468,6 +1706,179 @@ def get_new_ids(skip_update=False, limit=10, sortby='deltas',
     return new_ids
 
 
+def get_new_objects(limit_per_type=100, weak=False, shortnames=None,
+                    _state={}):
+    """Return objects allocated since last call.
+
+    Like :func:`get_new_ids`, but returns the new objects themselves,
+    collected during the same pass over the objects tracked by the garbage
+    collector.  Using :func:`get_new_ids` and then :func:`at_addrs` needs
+    a second pass, during which some of the objects may have been freed and
+    their IDs reused by other objects.
+
+    Returns a dictionary mapping object type names to lists of objects that
+    have been created since the last time this function was called.  The
+    first call returns (a sample of) all objects.
+
+    ``limit_per_type`` (int): The maximum number of objects of each type to
+    return.  Use None to return all of them, but be aware that you'll be
+    keeping all of them alive for as long as you hold on to the result.
+
+    ``weak`` (bool): If True, returns weak references instead of the
+    objects for all objects that support weak references.
+
+    ``shortnames`` (bool): If True, classes with the same name but
+    defined in different modules will be lumped together.  If False,
+    all type names will be qualified with the module name.  If None (default),
+    ``get_new_objects`` will remember the value from previous calls, so it's
+    enough to prime this once.  By default the primed value is True.
+
+    ``_state`` (dict): Stores the IDs of the objects seen during the
+    previous call.  Never pass in this argument unless you know what you're
+    doing.
+
+    The caveats documented in :func:`growth` apply.
+
+    Example:
+
+        >>> _ = get_new_objects()
+        >>> a = [0, 1, 2]
+        >>> new_objects = get_new_objects()
+        >>> a in new_objects['list']
+        True
+
+    .. versionadded:: 3.7.0
+    """
+    if not _state:
+        _state['old'] = {}
+        _state['shortnames'] = True
+    if shortnames is None:
+        shortnames = _state['shortnames']
+    else:
+        _state['shortnames'] = shortnames
+    if shortnames:
+        typename = _short_typename
+    else:
+        typename = _long_typename
+    old_ids = _state['old']
+    current_ids = collections.defaultdict(set)
+    new_objects = collections.defaultdict(list)
+    no_ids = frozenset()
+    gc.collect()
+    objects = gc.get_objects()
+    try:
+        for o in objects:
+            class_name = typename(o)
+            id_number = id(o)
+            current_ids[class_name].add(id_number)
+            if id_number in old_ids.get(class_name, no_ids):
+                continue
+            found = new_objects[class_name]
+            if limit_per_type is not None and len(found) >= limit_per_type:
+                continue
+            if weak:
+                try:
+                    found.append(weakref.ref(o))
+                    continue
+                except TypeError:
+                    pass
+            found.append(o)
+    finally:
+        del objects  # clear cyclic references to frame
+    _state['old'] = current_ids
+    return dict(new_objects)
+
+
+def get_new_allocation_sites(limit=10, new_ids=None, file=None):
+    """Find out where the objects found by :func:`get_new_ids` were allocated.
+
+    Uses :func:`tracemalloc.get_object_traceback` to group new objects by
+    type and by the source line that allocated them.  The :mod:`tracemalloc`
+    module must have been tracing memory allocations when the objects were
+    created, otherwise their allocation site is reported as ``?``.
+
+    Returns a dictionary mapping ``(type_name, call_site)`` tuples to
+    ``(count, size)`` tuples, where ``size`` is the total size in bytes as
+    reported by :func:`sys.getsizeof`.
+
+    ``limit`` (int): The maximum number of rows that you want to print
+    data for.  Use 0 to suppress the printing.  Use None to print everything.
+
+    ``new_ids`` (dict): A dictionary mapping type names to sets of object
+    IDs, like the one returned by :func:`get_new_ids`.  By default uses the
+    result of the last :func:`get_new_ids` call.
+
+    All the objects are located in a single pass over the objects tracked
+    by the garbage collector, so this is fast even for large sets of IDs.
+
+    Raises RuntimeError if :mod:`tracemalloc` is not tracing memory
+    allocations.
+
+    Example:
+
+        >>> tracemalloc.start()
+        >>> _ = get_new_ids(limit=0)
+        >>> a = [{'n': n} for n in range(10)]
+        >>> _ = get_new_ids(limit=0)
+        >>> _ = get_new_allocation_sites(limit=2)
+        ===========================================
+        Type        Count        Bytes  Call_site
+        ===========================================
+        dict           10         1840  <stdin>:1
+        list            1          184  <stdin>:1
+        ===========================================
+
+    .. versionadded:: 3.7.0
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError('the tracemalloc module must be tracing memory'
+                           ' allocations to find allocation sites')
+    if new_ids is None:
+        new_ids = get_new_ids(skip_update=True)
+    typenames = {}
+    for class_name, ids_set in new_ids.items():
+        for id_number in ids_set:
+            typenames[id_number] = class_name
+    sites = {}
+    stats = {}
+    for o in gc.get_objects():
+        class_name = typenames.get(id(o))
+        if class_name is None:
+            continue
+        traceback = tracemalloc.get_object_traceback(o)
+        if traceback is None:
+            site = '?'
+        else:
+            frame = traceback[-1]
+            key = (frame.filename, frame.lineno)
+            site = sites.get(key)
+            if site is None:
+                site = sites[key] = '%s:%d' % key
+        key = (class_name, site)
+        count, size = stats.get(key, (0, 0))
+        stats[key] = (count + 1, size + sys.getsizeof(o, 0))
+    o = None
+    rows = sorted(stats.items(), key=operator.itemgetter(1, 0),
+                  reverse=True)
+    if limit is not None:
+        rows = rows[:limit]
+    if not rows:
+        return stats
+    if file is None:
+        file = sys.stdout
+    width = max(len(class_name) for (class_name, site), _ in rows)
+    line = '=' * (width + 13*2 + 2 + max(len(site) for (_, site), _ in rows))
+    print(line, file=file)
+    print('%-*s%13s%13s  %s' % (width, 'Type', 'Count', 'Bytes', 'Call_site'),
+          file=file)
+    print(line, file=file)
+    for (class_name, site), (count, size) in rows:
+        print('%-*s%13d%13d  %s' % (width, class_name, count, size, site),
+              file=file)
+    print(line, file=file)
+    return stats
+
+
 def get_leaking_objects(objects=None):
     """Return objects that do not have any referents.
 
@@ -503,6 +1914,315 @@ def get_leaking_objects(objects=None):
         del objects, i  # clear cyclic references to frame
 
 
+def get_unreachable_objects(extra_roots=()):
+    """Return objects that cannot be reached from any module or thread.
+
+    Marks every object tracked by the GC that can be reached from
+    ``sys.modules``, from the local variables of every thread's stack, or
+    from any of the objects in ``extra_roots``, and returns the ones that
+    were not marked.
+
+    These objects are alive, but only because something outside Python
+    code refers to them: a C extension module, an untracked container, or
+    a reference-counting bug.  Unlike :func:`get_leaking_objects` this
+    also finds such objects when they refer to each other in a cycle.
+
+    Note that the interpreter and some C extension modules legitimately
+    keep references to objects that are not reachable from any module,
+    so some of these are to be expected.  The registries of subclasses
+    that the interpreter keeps for every type (dicts of weak references)
+    are left out.
+
+    The mark phase is iterative and remembers visited objects in a
+    bytearray indexed by a sorted array of object IDs, so it can handle
+    very large heaps.
+
+    Example:
+
+        >>> typestats(get_unreachable_objects())
+        {'list': 3, 'dict': 2, 'MyClass': 100, ...}
+
+    .. versionadded:: 3.7.0
+    """
+    gc.collect()
+    objects = gc.get_objects()
+    try:
+        ids = array.array('Q', sorted(map(id, objects)))
+        ids.append(2**64 - 1)  # so bisect never runs past the end
+        visited = bytearray(len(ids))
+        frames = sys._current_frames()
+        frames[threading.get_ident()] = sys._getframe(1)
+        stack = [sys.modules]
+        stack.extend(extra_roots)
+        for frame in frames.values():
+            while frame is not None:
+                stack.extend(frame.f_locals.values())
+                frame = frame.f_back
+        del frames, frame
+        # Objects that are not tracked by the GC (or were created after
+        # gc.get_objects() was called), apart from atoms like strings,
+        # which only refer to their (builtin) type and are too many to
+        # remember.
+        seen = set()
+        while stack:
+            o = stack.pop()
+            i = bisect.bisect_left(ids, id(o))
+            if ids[i] == id(o):
+                if visited[i]:
+                    continue
+                visited[i] = 1
+            elif type(o) in _ATOMIC_TYPES or id(o) in seen:
+                continue
+            else:
+                seen.add(id(o))
+            stack.extend(_referents(o, follow_types=True))
+        del o, seen
+        for o in objects:
+            if _is_subclass_registry(o):
+                for r in itertools.chain([o], o.values()):
+                    i = bisect.bisect_left(ids, id(r))
+                    if ids[i] == id(r):
+                        visited[i] = 1
+        o = r = None
+        # Not a list comprehension, which would put ids and visited in
+        # cells that would be reported as unreachable.
+        result = []
+        for o in objects:
+            if not visited[bisect.bisect_left(ids, id(o))]:
+                result.append(o)
+        return result
+    finally:
+        del objects  # clear cyclic references to frame
+
+
+_ATOMIC_TYPES = frozenset([type(None), bool, int, float, complex, str, bytes])
+
+
+def _is_subclass_registry(obj):
+    """Check if ``obj`` is a dict of the subclasses of some type.
+
+    The interpreter keeps weak references to the subclasses of each type
+    in a dict keyed by their IDs, which nothing visible to Python refers to.
+    """
+    if type(obj) is not dict or not obj:
+        return False
+    for key, ref in obj.items():
+        if type(ref) is not weakref.ref:
+            return False
+        cls = ref()
+        if cls is not None and (not _isinstance(cls, type)
+                                or key != id(cls)):
+            return False
+    return True
+
+
+def find_cycles(objects=None):
+    """Return groups of objects that form reference cycles.
+
+    Computes the strongly connected components of the reference graph
+    (as seen by :func:`gc.get_referents`) and returns those that contain
+    a cycle, as a list of lists of objects.  Objects in reference cycles
+    cannot be freed by reference counting alone: they stay in memory until
+    the cyclic garbage collector gets around to them.
+
+    If you pass in a list of ``objects``, only references between those
+    objects are considered, otherwise all the objects tracked by the
+    garbage collector are examined.  The graph is traversed iteratively,
+    so deep structures do not hit the recursion limit.
+
+    Note that this does not call :func:`gc.collect` first, so cycles that
+    are already garbage and are waiting to be collected will be reported
+    too.
+
+    Example:
+
+        >>> a = MyClass(); b = MyClass(); a.other = b; b.other = a
+        >>> find_cycles([a, b, a.__dict__, b.__dict__])
+        [[<MyClass object at ...>, {...}, <MyClass object at ...>, {...}]]
+
+    See also: :func:`cycle_stats`.
+
+    .. versionadded:: 3.7.0
+    """
+    if objects is None:
+        objects = gc.get_objects()
+    try:
+        return [[objects[i] for i in component]
+                for component in _strongly_connected_components(objects)]
+    finally:
+        del objects  # clear cyclic references to frame
+
+
+def cycle_stats(limit=10, objects=None, shortnames=True):
+    """Summarise the reference cycles by the types of objects in them.
+
+    Returns a list of ``(composition, count, size, representative)``,
+    sorted by ``count``, most frequent first.  ``composition`` is a tuple
+    of ``(type_name, number_of_objects)`` pairs describing one cycle,
+    ``count`` is the number of cycles with that exact composition, ``size``
+    is the total size in bytes (as reported by :func:`sys.getsizeof`) of
+    all the objects in all of those cycles, and ``representative`` is one
+    of the objects from one such cycle, ready to be passed to
+    :func:`show_refs`.
+
+    Limits the return value to at most ``limit`` items.  You may set
+    ``limit`` to None to avoid that.
+
+    The caveats documented in :func:`find_cycles` apply.
+
+    Example:
+
+        >>> cycle_stats(limit=1)
+        [((('MyClass', 1), ('dict', 1)), 42, 11088, <MyClass object ...>)]
+
+    .. versionadded:: 3.7.0
+    """
+    if shortnames:
+        typename = _short_typename
+    else:
+        typename = _long_typename
+    stats = {}
+    for component in find_cycles(objects):
+        names = collections.Counter(typename(o) for o in component)
+        composition = tuple(sorted(names.items()))
+        size = sum(sys.getsizeof(o, 0) for o in component)
+        if composition in stats:
+            stats[composition][0] += 1
+            stats[composition][1] += size
+        else:
+            stats[composition] = [1, size, component[0]]
+    result = sorted(((composition, count, size, representative)
+                     for composition, (count, size, representative)
+                     in stats.items()),
+                    key=operator.itemgetter(1, 2), reverse=True)
+    if limit:
+        result = result[:limit]
+    return result
+
+
+def show_cycle_stats(limit=10, objects=None, shortnames=True, file=None):
+    """Print the table of the most common kinds of reference cycles.
+
+    The columns show the number of cycles, their total size in bytes,
+    and the types of objects that make up each cycle.
+
+    The caveats documented in :func:`find_cycles` apply.
+
+    Example:
+
+        >>> show_cycle_stats(limit=3)
+            104     103168  tuple, type
+             42      11088  MyClass, dict
+             41      52376  dict, getset_descriptor, tuple, type
+
+    .. versionadded:: 3.7.0
+    """
+    if file is None:
+        file = sys.stdout
+    for composition, count, size, _ in cycle_stats(limit, objects,
+                                                   shortnames=shortnames):
+        description = ', '.join(name if n == 1 else '%s x%d' % (name, n)
+                                for name, n in composition)
+        file.write('%7d %10d  %s\n' % (count, size, description))
+
+
+class GarbageReport(object):
+    """Cyclic garbage found by :func:`garbage_report`.
+
+    Attributes:
+
+    ``collected``
+        the number of unreachable objects found.
+
+    ``typestats``
+        a dictionary from type names to the number of garbage objects of
+        that type, like the one returned by :func:`typestats`.
+
+    ``cycles``
+        a list of ``(composition, count, size)`` tuples, like the ones
+        returned by :func:`cycle_stats`, minus the representatives.
+
+    ``collect_time``
+        CPU time (in seconds) spent by the collection that found the
+        garbage (but, because of ``gc.DEBUG_SAVEALL``, did not free it).
+
+    ``free_time``
+        CPU time (in seconds) spent by the collection that actually freed
+        the garbage.
+
+    .. versionadded:: 3.7.0
+    """
+
+    def __init__(self):
+        self.collected = 0
+        self.typestats = {}
+        self.cycles = []
+        self.collect_time = 0.0
+        self.free_time = 0.0
+
+
+@contextlib.contextmanager
+def garbage_report(shortnames=True):
+    """Analyse the cyclic garbage created inside a ``with`` block.
+
+    Collects garbage on entry, then enables ``gc.DEBUG_SAVEALL`` and
+    disables automatic garbage collection for the duration of the block.
+    On exit runs one collection, which saves all the unreachable objects in
+    ``gc.garbage`` instead of freeing them, summarises them by type and by
+    cycle, restores the previous garbage collector settings, removes the
+    objects from ``gc.garbage`` and frees them.
+
+    Yields a :class:`GarbageReport` that gets filled in when the block
+    exits.
+
+    Example:
+
+        >>> with garbage_report() as report:
+        ...     for n in range(100):
+        ...         obj = MyClass()
+        ...         obj.self = obj
+        >>> report.typestats
+        {'MyClass': 100, 'dict': 100}
+        >>> report.cycles
+        [((('MyClass', 1), ('dict', 1)), 100, 15200)]
+        >>> report.collect_time, report.free_time
+        (0.0019, 0.0023)
+
+    See also :doc:`uncollectable`.
+
+    .. versionadded:: 3.7.0
+    """
+    report = GarbageReport()
+    gc.collect()
+    start = len(gc.garbage)
+    flags = gc.get_debug()
+    enabled = gc.isenabled()
+    gc.set_debug(flags | gc.DEBUG_SAVEALL)
+    gc.disable()
+    try:
+        yield report
+        t0 = time.process_time()
+        gc.collect()
+        report.collect_time = time.process_time() - t0
+    finally:
+        gc.set_debug(flags)
+        if enabled:
+            gc.enable()
+        garbage = gc.garbage[start:]
+        del gc.garbage[start:]
+    try:
+        report.collected = len(garbage)
+        report.typestats = typestats(garbage, shortnames)
+        report.cycles = [(composition, count, size)
+                         for composition, count, size, _
+                         in cycle_stats(None, garbage, shortnames)]
+    finally:
+        t0 = time.process_time()
+        del garbage
+        gc.collect()
+        report.free_time = time.process_time() - t0
+
+
 def by_type(typename, objects=None):
     """Return objects tracked by the garbage collector with a given class name.
 
@@ -578,6 +2298,100 @@ def at_addrs(address_set):
     return res
 
 
+def track(obj, label=None):
+    """Keep an eye on the lifetime of an object.
+
+    Registers a weak reference to ``obj`` under the given ``label`` (which
+    defaults to the short type name of ``obj``), so that you can later see
+    whether it is still alive with :func:`tracked_counts` or
+    :func:`tracked_survivors`, and how long tracked objects lived with
+    :func:`lifetime_histogram`.  These checks only look at the tracked
+    objects, so they're cheap no matter how large the heap is.
+
+    Returns ``obj``, so you can write ``x = track(MyClass())``.
+
+    Raises TypeError if ``obj`` does not support weak references (e.g.
+    instances of ``list``, ``dict``, or of classes that define
+    ``__slots__`` without ``__weakref__``).
+
+    Example:
+
+        >>> obj = track(MyClass(), 'session')
+        >>> tracked_counts()
+        {'session': 1}
+
+    .. versionadded:: 3.7.0
+    """
+    if label is None:
+        label = _short_typename(obj)
+    ref = weakref.ref(obj, _tracked_object_died)
+    _tracked[id(ref)] = (ref, label, time.monotonic())
+    return obj
+
+
+def tracked_counts():
+    """Count the live objects registered with :func:`track`.
+
+    Returns a dictionary mapping labels to numbers of live objects.
+
+    .. versionadded:: 3.7.0
+    """
+    counts = {}
+    for ref, label, birth in list(_tracked.values()):
+        counts[label] = counts.get(label, 0) + 1
+    return counts
+
+
+def tracked_survivors(older_than, label=None):
+    """Return the tracked objects that have been alive for a while.
+
+    Returns a list of ``(label, age, obj)`` tuples for all the live objects
+    registered with :func:`track` more than ``older_than`` seconds ago,
+    oldest first.  If ``label`` is specified, only objects registered with
+    that label are returned.
+
+    Example:
+
+        >>> tracked_survivors(60, 'session')
+        [('session', 3600.2, <Session object at 0x...>)]
+
+    .. versionadded:: 3.7.0
+    """
+    now = time.monotonic()
+    result = []
+    for ref, obj_label, birth in list(_tracked.values()):
+        if label is not None and obj_label != label:
+            continue
+        if now - birth <= older_than:
+            continue
+        obj = ref()
+        if obj is not None:
+            result.append((obj_label, now - birth, obj))
+    result.sort(key=operator.itemgetter(1), reverse=True)
+    return result
+
+
+def lifetime_histogram(label):
+    """Show how long the tracked objects with a given label lived.
+
+    Returns a list of ``(max_lifetime, count)`` tuples, where ``count`` is
+    the number of objects registered with :func:`track` that have been
+    freed after living for more than the previous bucket's
+    ``max_lifetime`` but at most this bucket's ``max_lifetime`` seconds.
+    The last bucket's ``max_lifetime`` is infinity.
+
+    Example:
+
+        >>> lifetime_histogram('session')
+        [(0.001, 0), (0.01, 0), (0.1, 12), (1, 1043), (10, 5), (60, 0),
+         (600, 0), (3600, 0), (inf, 0)]
+
+    .. versionadded:: 3.7.0
+    """
+    counts = _tracked_lifetimes.get(label, [0] * len(_LIFETIME_BUCKETS))
+    return list(zip(_LIFETIME_BUCKETS, counts))
+
+
 def find_ref_chain(obj, predicate, max_depth=20, extra_ignore=()):
     """Find a shortest chain of references leading from obj.
 
@@ -630,10 +2444,113 @@ def find_backref_chain(obj, predicate, max_depth=20, extra_ignore=()):
                        max_depth=max_depth, extra_ignore=extra_ignore)
 
 
+def find_backref_paths(objs, predicate, max_depth=20, extra_ignore=(),
+                       shortnames=True):
+    """Find the distinct kinds of reference chains leading to objs.
+
+    Like calling :func:`find_backref_chain` for every object in ``objs``,
+    but searches backwards from all of them at once, which takes one pass
+    over all the objects tracked by the garbage collector for each level of
+    depth instead of a separate search for each object.
+
+    Objects are grouped by the type names of the objects on their shortest
+    chain from an object that matches ``predicate``, so if 40,000 instances
+    of ``Session`` are all kept in one dictionary in some module, you get
+    one result that tells you so.
+
+    Returns a list of ``(path, count, chain)`` tuples sorted by ``count``,
+    largest first, where ``path`` is a tuple of type names, ``count`` is the
+    number of objects kept alive by chains of this kind, and ``chain`` is one
+    example chain, as would be returned by :func:`find_backref_chain`.  The
+    objects for which no chain was found are reported with a ``path`` of just
+    their type name and a ``chain`` of just one of them.
+
+    ``predicate``, ``max_depth`` and ``extra_ignore`` have the same meaning as
+    for :func:`find_backref_chain`.  ``shortnames`` has the same meaning as
+    for :func:`typestats`.
+
+    Example:
+
+        >>> find_backref_paths(by_type('MyClass'), is_proper_module)
+        [(('module', 'dict', 'dict', 'MyClass'), 40000, [<module ...>, ...]),
+         (('module', 'dict', 'list', 'MyClass'), 12, [<module ...>, ...])]
+
+    .. versionadded:: 3.7.0
+    """
+    if shortnames:
+        typename = _short_typename
+    else:
+        typename = _long_typename
+    nodes = {id(o): o for o in objs}
+    targets = list(nodes)
+    roots = [id_number for id_number, o in nodes.items() if predicate(o)]
+    frontier = set(nodes).difference(roots)
+    referrers = collections.defaultdict(list)
+    ignore = set(extra_ignore)
+    ignore.update(map(id, [extra_ignore, objs, nodes, targets, roots,
+                           frontier, referrers, ignore]))
+    ignore.add(id(sys._getframe()))   # this function
+    gc.collect()
+    depth = 0
+    while frontier and depth < max_depth:
+        new_frontier = set()
+        objects = gc.get_objects()
+        try:
+            for o in objects:
+                if id(o) in ignore:
+                    continue
+                for r in gc.get_referents(o):
+                    if id(r) not in frontier:
+                        continue
+                    referrers[id(r)].append(id(o))
+                    if id(o) in nodes:
+                        continue
+                    nodes[id(o)] = o
+                    if predicate(o):
+                        roots.append(id(o))
+                    else:
+                        new_frontier.add(id(o))
+        finally:
+            del objects, o  # clear cyclic references to frame
+        frontier = new_frontier
+        depth += 1
+    # Now search forwards from the roots to find the shortest chains.
+    referents = collections.defaultdict(list)
+    for target, sources in referrers.items():
+        for source in sources:
+            referents[source].append(target)
+    del referrers
+    parent = dict.fromkeys(roots)
+    queue = collections.deque(roots)
+    while queue:
+        source = queue.popleft()
+        for target in referents[source]:
+            if target not in parent:
+                parent[target] = source
+                queue.append(target)
+    paths = {}
+    for target in targets:
+        if target in parent:
+            chain = [nodes[target]]
+            while parent[id(chain[-1])] is not None:
+                chain.append(nodes[parent[id(chain[-1])]])
+            chain.reverse()
+        else:
+            chain = [nodes[target]]
+        path = tuple(typename(o) for o in chain)
+        if path in paths:
+            paths[path][1] += 1
+        else:
+            paths[path] = [path, 1, chain]
+    return sorted((tuple(row) for row in paths.values()),
+                  key=lambda row: (-row[1], row[0]))
+
+
 def show_backrefs(objs, max_depth=3, extra_ignore=(), filter=None, too_many=10,
                   highlight=None, filename=None, extra_info=None,
                   refcounts=False, shortnames=True, output=None,
-                  extra_node_attrs=None):
+                  extra_node_attrs=None, max_nodes=None, max_edges=None,
+                  time_limit=None, compact=False):
     """Generate an object reference graph ending at ``objs``.
 
     The graph will show you what objects refer to ``objs``, directly and
@@ -658,9 +2575,19 @@ def show_backrefs(objs, max_depth=3, extra_ignore=(), filter=None, too_many=10,
     Use ``max_depth`` and ``too_many`` to limit the depth and breadth of the
     graph.
 
+    Use ``max_nodes``, ``max_edges`` and ``time_limit`` (in seconds) to put
+    a hard upper bound on the total amount of work done.  When any of these
+    limits is reached the traversal stops and the nodes that were not fully
+    explored are drawn with a dashed red border.
+
     Use ``filter`` (a predicate) and ``extra_ignore`` (a list of object IDs) to
     remove undesired objects from the graph.
 
+    Specify ``compact=True`` to leave out instance dictionaries, frame
+    ``f_locals`` and bound methods and draw the references through them as
+    direct arrows from their owners, labelled with the attribute names.
+    This makes graphs smaller and faster to render.
+
     Use ``highlight`` (a predicate) to highlight certain graph nodes in blue.
 
     Use ``extra_info`` (a function taking one argument and returning a
@@ -703,6 +2630,10 @@ def show_backrefs(objs, max_depth=3, extra_ignore=(), filter=None, too_many=10,
 
     .. versionchanged:: 3.5
        New parameter: ``extra_node_attrs``.
+
+    .. versionchanged:: 3.7.0
+       New parameters: ``max_nodes``, ``max_edges``, ``time_limit``,
+       ``compact``.
     """
     # For show_backrefs(), it makes sense to stop when reaching a
     # module because you'll end up in sys.modules and explode the
@@ -714,13 +2645,16 @@ def show_backrefs(objs, max_depth=3, extra_ignore=(), filter=None, too_many=10,
                        filename=filename, output=output, extra_info=extra_info,
                        refcounts=refcounts, shortnames=shortnames,
                        cull_func=is_proper_module,
-                       extra_node_attrs=extra_node_attrs)
+                       extra_node_attrs=extra_node_attrs,
+                       max_nodes=max_nodes, max_edges=max_edges,
+                       time_limit=time_limit, compact=compact)
 
 
 def show_refs(objs, max_depth=3, extra_ignore=(), filter=None, too_many=10,
               highlight=None, filename=None, extra_info=None,
               refcounts=False, shortnames=True, output=None,
-              extra_node_attrs=None):
+              extra_node_attrs=None, max_nodes=None, max_edges=None,
+              time_limit=None, compact=False):
     """Generate an object reference graph starting at ``objs``.
 
     The graph will show you what objects are reachable from ``objs``, directly
@@ -745,9 +2679,19 @@ def show_refs(objs, max_depth=3, extra_ignore=(), filter=None, too_many=10,
     Use ``max_depth`` and ``too_many`` to limit the depth and breadth of the
     graph.
 
+    Use ``max_nodes``, ``max_edges`` and ``time_limit`` (in seconds) to put
+    a hard upper bound on the total amount of work done.  When any of these
+    limits is reached the traversal stops and the nodes that were not fully
+    explored are drawn with a dashed red border.
+
     Use ``filter`` (a predicate) and ``extra_ignore`` (a list of object IDs) to
     remove undesired objects from the graph.
 
+    Specify ``compact=True`` to leave out instance dictionaries, frame
+    ``f_locals`` and bound methods and draw the references through them as
+    direct arrows from their owners, labelled with the attribute names.
+    This makes graphs smaller and faster to render.
+
     Use ``highlight`` (a predicate) to highlight certain graph nodes in blue.
 
     Use ``extra_info`` (a function returning a string) to report extra
@@ -787,13 +2731,561 @@ def show_refs(objs, max_depth=3, extra_ignore=(), filter=None, too_many=10,
 
     .. versionchanged:: 3.5
        New parameter: ``extra_node_attrs``.
+
+    .. versionchanged:: 3.7.0
+       New parameters: ``max_nodes``, ``max_edges``, ``time_limit``,
+       ``compact``.
     """
     return _show_graph(objs, max_depth=max_depth, extra_ignore=extra_ignore,
                        filter=filter, too_many=too_many, highlight=highlight,
                        edge_func=gc.get_referents, swap_source_target=True,
                        filename=filename, extra_info=extra_info,
                        refcounts=refcounts, shortnames=shortnames,
-                       output=output, extra_node_attrs=extra_node_attrs)
+                       output=output, extra_node_attrs=extra_node_attrs,
+                       max_nodes=max_nodes, max_edges=max_edges,
+                       time_limit=time_limit, compact=compact)
+
+
+def show_type_graph(min_count=100, shortnames=True, filter=None,
+                    filename=None, output=None):
+    """Generate a graph of references between types of objects.
+
+    Looks at every reference from every object tracked by the garbage
+    collector and draws an arrow from type A to type B labelled with the
+    number of references from objects of type A to objects of type B.  The
+    objects themselves are not drawn, so this works even for heaps with
+    millions of objects, and gives you an overview of what refers to what.
+
+    Arrows representing fewer than ``min_count`` references are left out,
+    and so are the types that have no arrows left.
+
+    If ``filter`` is specified, it should be a function taking one argument and
+    returning a boolean. References from objects for which ``filter(obj)``
+    returns ``False`` will be ignored.
+
+    ``shortnames``, ``filename`` and ``output`` have the same meaning as for
+    :func:`show_refs`.
+
+    Example:
+
+        >>> show_type_graph(min_count=1000, filename='types.png')
+        Graph written to ....dot (23 nodes, 41 edges)
+        Image generated as types.png
+
+    .. versionadded:: 3.7.0
+    """
+    gc.collect()
+    objects = gc.get_objects()
+    edges = collections.Counter()
+    try:
+        for o in objects:
+            if filter and not filter(o):
+                continue
+            source = type(o)
+            for r in gc.get_referents(o):
+                edges[source, type(r)] += 1
+    finally:
+        del objects  # clear cyclic references to frame
+    # Types with the same name may be lumped together.
+    weights = collections.Counter()
+    for (source, target), count in edges.items():
+        if shortnames:
+            source, target = source.__name__, target.__name__
+        else:
+            source = _long_typename_of_type(source)
+            target = _long_typename_of_type(target)
+        weights[source, target] += count
+    del edges
+    weights = sorted(((edge, count) for edge, count in weights.items()
+                      if count >= min_count),
+                     key=operator.itemgetter(1), reverse=True)
+    names = sorted(set(name for edge, _ in weights for name in edge))
+    node_ids = {name: 't%d' % n for n, name in enumerate(names)}
+    f, dot_filename = _open_graph_output(filename, output)
+    f.write('digraph TypeGraph {\n'
+            '  node[shape=box, style=filled, fillcolor=white];\n')
+    for name in names:
+        f.write('  %s[label="%s"];\n' % (node_ids[name], _quote(name)))
+    for (source, target), count in weights:
+        f.write('  %s -> %s [label="%d",penwidth=%g];\n'
+                % (node_ids[source], node_ids[target], count,
+                   1 + math.log10(count)))
+    f.write("}\n")
+    return _close_graph_output(f, dot_filename, filename, output,
+                               "%d nodes, %d edges"
+                               % (len(names), len(weights)))
+
+
+def browse(objs, port=0, addr='127.0.0.1', too_many=100, extra_ignore=(),
+           filter=None, extra_info=None, shortnames=True):
+    """Explore the object reference graph in a web browser.
+
+    Starts a daemon thread running an HTTP server on ``addr``:``port`` that
+    serves a page showing ``objs``.  Each object on the page can be expanded
+    to show the objects it refers to, or the objects that refer to it; they
+    are only looked up when you ask for them, so you can follow a long chain
+    of references without drawing a huge graph first.
+
+    The objects that have been shown are kept alive until the server is
+    shut down.
+
+    The page shows the reprs of arbitrary objects, so it is only served
+    under a secret random path, and requests whose ``Host`` header names
+    some other host are rejected, so that web pages can't get at it by
+    pointing a DNS name at the server's address.
+
+    ``too_many``, ``extra_ignore``, ``filter``, ``extra_info`` and
+    ``shortnames`` have the same meaning as for :func:`show_backrefs`,
+    except that ``too_many`` applies to each expansion.
+
+    Returns the server object; call its ``shutdown()`` method to stop
+    serving.  With the default ``port=0`` a free port is picked.  Open
+    ``server.url`` to see the page.
+
+    Example:
+
+        >>> server = browse(obj)
+        >>> print(server.url)
+        http://127.0.0.1:41563/Uw8MwG1rq4SvGBbJKq2a5Q/
+
+    .. versionadded:: 3.7.0
+    """
+    import http.server
+    import secrets
+    import urllib.parse
+
+    if not _isinstance(objs, (list, tuple)):
+        objs = [objs]
+    prefix = '/%s/' % secrets.token_urlsafe(16)
+    hosts = {addr, 'localhost', '127.0.0.1'}
+    # Objects that have been shown, by ID.
+    nodes = {id(obj): obj for obj in objs}
+    roots = list(nodes)
+    labels = {}
+    expansions = {}
+    lock = threading.Lock()
+    ignore = set(extra_ignore)
+    ignore.update(map(id, [extra_ignore, objs, nodes, roots, labels,
+                           expansions, ignore]))
+
+    def describe(id_number):
+        if id_number not in labels:
+            labels[id_number] = _obj_label_lines(nodes[id_number],
+                                                 extra_info, shortnames)
+        return {'id': str(id_number), 'label': labels[id_number]}
+
+    def expand(id_number, backrefs):
+        key = (id_number, backrefs)
+        if key not in expansions:
+            obj = nodes[id_number]
+            if backrefs:
+                neighbours = gc.get_referrers(obj)
+            else:
+                neighbours = gc.get_referents(obj)
+            # These only live as long as this call, so don't remember them
+            # in ignore, where their IDs might later be reused.
+            transient = (id(sys._getframe()), id(neighbours))
+            children = []
+            skipped = 0
+            for n in neighbours:
+                if (id(n) in ignore or id(n) in transient
+                        or (filter and not filter(n))):
+                    continue
+                if len(children) >= too_many:
+                    skipped += 1
+                    continue
+                nodes.setdefault(id(n), n)
+                if backrefs:
+                    label = _edge_label_parts(n, obj, shortnames)[0]
+                else:
+                    label = _edge_label_parts(obj, n, shortnames)[0]
+                children.append((id(n), label))
+            expansions[key] = children, skipped
+            obj = n = neighbours = None
+        children, skipped = expansions[key]
+        return {'nodes': [dict(describe(child), edge=label)
+                          for child, label in children],
+                'more': skipped}
+
+    class BrowserHandler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            host = urllib.parse.urlsplit('//' + self.headers.get('Host', ''))
+            if host.hostname not in hosts:
+                self.send_error(403)
+                return
+            url = urllib.parse.urlsplit(self.path)
+            query = urllib.parse.parse_qs(url.query)
+            try:
+                if not url.path.startswith(prefix):
+                    raise KeyError(url.path)
+                path = url.path[len(prefix) - 1:]
+                with lock:
+                    if path == '/':
+                        body = _BROWSER_PAGE
+                        content_type = 'text/html'
+                    elif path == '/roots':
+                        body = json.dumps(
+                            {'nodes': [describe(root) for root in roots]})
+                        content_type = 'application/json'
+                    elif path == '/expand':
+                        body = json.dumps(
+                            expand(int(query['id'][0]),
+                                   query['dir'][0] == 'backrefs'))
+                        content_type = 'application/json'
+                    else:
+                        raise KeyError(url.path)
+            except (KeyError, ValueError):
+                self.send_error(404)
+                return
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type + '; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((addr, port), BrowserHandler)
+    server.daemon_threads = True
+    server.url = 'http://%s:%d%s' % (server.server_address + (prefix, ))
+    thread = threading.Thread(target=server.serve_forever,
+                              name='objgraph-browser', daemon=True)
+    thread.start()
+    return server
+
+
+_BROWSER_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>objgraph</title>
+<style>
+body { font-family: sans-serif; }
+ul { list-style: none; padding-left: 1.5em; }
+.label { font-family: monospace; white-space: pre-wrap; }
+.edge { color: gray; }
+button { font-size: smaller; margin-left: 0.5em; }
+</style>
+</head>
+<body>
+<ul id="roots"></ul>
+<script>
+function span(className, text) {
+  var result = document.createElement('span');
+  result.className = className;
+  result.textContent = text;
+  return result;
+}
+function node(data) {
+  var li = document.createElement('li');
+  if (data.edge) {
+    li.appendChild(span('edge', data.edge + ': '));
+  }
+  li.appendChild(span('label', data.label.join('  ')));
+  [['backrefs', 'referrers'], ['refs', 'referents']].forEach(function (d) {
+    var button = document.createElement('button');
+    var children = null;
+    button.textContent = d[1];
+    button.onclick = function () {
+      if (children) {
+        children.hidden = !children.hidden;
+        return;
+      }
+      children = document.createElement('ul');
+      children.appendChild(span('edge', d[1] + ':'));
+      li.appendChild(children);
+      fetch('expand?id=' + data.id + '&dir=' + d[0])
+        .then(function (response) { return response.json(); })
+        .then(function (result) {
+          result.nodes.forEach(function (n) {
+            children.appendChild(node(n));
+          });
+          if (result.more) {
+            children.appendChild(span('edge', result.more + ' more'));
+          }
+        });
+    };
+    li.appendChild(button);
+  });
+  return li;
+}
+fetch('roots')
+  .then(function (response) { return response.json(); })
+  .then(function (result) {
+    var roots = document.getElementById('roots');
+    result.nodes.forEach(function (n) { roots.appendChild(node(n)); });
+  });
+</script>
+</body>
+</html>
+"""
+
+
+class GraphSession(object):
+    """An object reference graph that can be grown a piece at a time.
+
+    :func:`show_backrefs` and :func:`show_refs` start from scratch every
+    time you call them.  A graph session remembers which objects it has
+    already visited, so you can draw a shallow graph first, then expand
+    the interesting nodes or go one level deeper, and only the new part of
+    the graph is looked up.  Node labels are computed once per object.
+
+    The session holds weak references to the objects in the graph where
+    possible, so it doesn't keep them alive, and objects that die disappear
+    from the graph.  Objects that don't support weak references (such as
+    lists and dicts) are kept alive until they are pruned from the graph.
+    Nothing is looked up until the graph is first shown or expanded.
+
+    ``backrefs`` picks the direction: follow referrers like
+    :func:`show_backrefs` (the default), or referents like
+    :func:`show_refs`.  The other arguments have the same meaning as for
+    those functions.
+
+    Example:
+
+        >>> session = GraphSession(obj, max_depth=2)
+        >>> session.deepen()
+        >>> session.prune('function')
+        >>> session.show(filename='session.png')
+        Graph written to ....dot (12 nodes)
+        Image generated as session.png
+
+    .. versionadded:: 3.7.0
+    """
+
+    def __init__(self, objs, backrefs=True, max_depth=3, extra_ignore=(),
+                 filter=None, too_many=10, extra_info=None, shortnames=True):
+        self.backrefs = backrefs
+        self.max_depth = max_depth
+        self.filter = filter
+        self.too_many = too_many
+        self.extra_info = extra_info
+        self.shortnames = shortnames
+        # Objects in the graph by ID, as weak references where possible.
+        self._weak = {}
+        self._strong = {}
+        self._depth = {}
+        self._labels = {}
+        # For every expanded node, a list of (neighbour ID, edge label).
+        self._edges = {}
+        self._skipped = {}
+        self._pruned = []
+        self._roots = []
+        self._ignore = set(extra_ignore)
+        self._ignore.update(map(id, [extra_ignore, self._strong,
+                                     self._pruned, self._ignore]))
+        if _isinstance(objs, (list, tuple)):
+            self._ignore.add(id(objs))
+        else:
+            objs = [objs]
+        for obj in objs:
+            if id(obj) not in self._depth:
+                self._add(obj, 0)
+                self._roots.append(id(obj))
+
+    def expand(self, node):
+        """Add the neighbours of ``node``, which must be in the graph.
+
+        This works even if ``node`` is as deep as ``max_depth``, or is a
+        module, which is otherwise not expanded when following referrers.
+        Nodes that have already been expanded are left as they are.
+        """
+        self._expand_all()
+        live = self._live()
+        if id(node) not in live:
+            raise ValueError('%s is not in the graph' % _safe_repr(node))
+        if id(node) not in self._edges:
+            self._expand(node, live)
+
+    def deepen(self, levels=1):
+        """Increase ``max_depth`` and expand the nodes that are now in reach.
+
+        Only the nodes at the old depth limit are looked at.
+        """
+        self.max_depth += levels
+        self._expand_all()
+
+    def prune(self, typename):
+        """Remove all objects of a type from the graph.
+
+        ``typename`` can be a type or a type name, with or without the
+        module name.  Objects of that type will also be left out of any
+        later expansions.  Objects that can no longer be reached from the
+        starting objects are removed too.  The starting objects themselves
+        are never removed.
+        """
+        self._pruned.append(typename)
+        live = self._live()
+        self._forget([i for i in live
+                      if i not in self._roots and self._is_pruned(live[i])])
+        # Recompute the depths of the nodes that are still reachable.
+        depth = dict.fromkeys(self._roots, 0)
+        queue = collections.deque(self._roots)
+        while queue:
+            i = queue.popleft()
+            for neighbour, label in self._edges.get(i, ()):
+                if neighbour not in depth:
+                    depth[neighbour] = depth[i] + 1
+                    queue.append(neighbour)
+        self._forget([i for i in live if i not in depth])
+        self._depth = depth
+
+    def show(self, filename=None, output=None):
+        """Draw the graph.
+
+        ``filename`` and ``output`` have the same meaning as for
+        :func:`show_backrefs`.
+        """
+        self._expand_all()
+        live = self._live()
+        f, dot_filename = _open_graph_output(filename, output)
+        f.write('digraph ObjectGraph {\n'
+                '  node[shape=box, style=filled, fillcolor=white];\n')
+        for i in self._roots:
+            f.write('  %s[fontcolor=red];\n' % _obj_node_id(live[i]))
+        for i in sorted(live, key=self._depth.__getitem__):
+            obj = live[i]
+            if i not in self._labels:
+                self._labels[i] = _obj_label(obj, self.extra_info,
+                                             shortnames=self.shortnames)
+            depth = min(self._depth[i], self.max_depth)
+            h, s, v = _gradient((0, 0, 1), (0, 0, .3), depth, self.max_depth)
+            if inspect.ismodule(obj):
+                h = .3
+                s = 1
+            f.write('  %s[label="%s",fillcolor="%g,%g,%g"];\n'
+                    % (_obj_node_id(obj), self._labels[i], h, s, v))
+            if v < 0.5:
+                f.write('  %s[fontcolor=white];\n' % (_obj_node_id(obj)))
+        obj = None
+        for i, edges in self._edges.items():
+            node = _node_id(i)
+            for neighbour, label in edges:
+                if self.backrefs:
+                    f.write('  %s -> %s%s;\n'
+                            % (_node_id(neighbour), node, label))
+                else:
+                    f.write('  %s -> %s%s;\n'
+                            % (node, _node_id(neighbour), label))
+            if self._skipped[i]:
+                if self.backrefs:
+                    label = "%d more backreferences" % self._skipped[i]
+                    edge = "too_many_%s->%s" % (node, node)
+                else:
+                    label = "%d more references" % self._skipped[i]
+                    edge = "%s->too_many_%s" % (node, node)
+                f.write('  %s[color=red,style=dotted,len=0.25,weight=10];\n'
+                        % edge)
+                f.write('  too_many_%s[label="%s",shape=box,height=0.25,'
+                        'color=red,fontsize=6];\n' % (node, label))
+        f.write("}\n")
+        return _close_graph_output(f, dot_filename, filename, output,
+                                   "%d nodes" % len(live))
+
+    def _add(self, obj, depth):
+        try:
+            self._weak[id(obj)] = weakref.ref(obj)
+        except TypeError:
+            self._strong[id(obj)] = obj
+        self._depth[id(obj)] = depth
+
+    def _live(self):
+        """Return a dict of all the objects in the graph, by ID.
+
+        Forgets the objects that have died since the last call.
+        """
+        live = dict(self._strong)
+        dead = []
+        for i, ref in self._weak.items():
+            obj = ref()
+            if obj is None:
+                dead.append(i)
+            else:
+                live[i] = obj
+        obj = None
+        self._forget(dead)
+        return live
+
+    def _forget(self, ids):
+        if not ids:
+            return
+        ids = set(ids)
+        for i in ids:
+            self._weak.pop(i, None)
+            self._strong.pop(i, None)
+            self._depth.pop(i, None)
+            self._labels.pop(i, None)
+            self._edges.pop(i, None)
+            self._skipped.pop(i, None)
+        self._roots = [i for i in self._roots if i not in ids]
+        for i, edges in self._edges.items():
+            edges[:] = [edge for edge in edges if edge[0] not in ids]
+
+    def _is_pruned(self, obj):
+        for typename in self._pruned:
+            if _isinstance(typename, str):
+                if typename in (_short_typename(obj), _long_typename(obj)):
+                    return True
+            elif type(obj) is typename:
+                return True
+        return False
+
+    def _expand_all(self):
+        live = self._live()
+        queue = collections.deque(sorted(
+            (i for i, depth in self._depth.items()
+             if depth < self.max_depth and i not in self._edges),
+            key=self._depth.__getitem__))
+        while queue:
+            i = queue.popleft()
+            if self.backrefs and is_proper_module(live[i]):
+                # Like show_backrefs(), stop at modules: everything that
+                # refers to them is just import machinery.
+                continue
+            for neighbour in self._expand(live[i], live):
+                if self._depth[neighbour] < self.max_depth:
+                    queue.append(neighbour)
+
+    def _expand(self, target, live):
+        """Look up the neighbours of ``target`` and add them to the graph.
+
+        Returns the IDs of the nodes that were added.
+        """
+        if self.backrefs:
+            neighbours = gc.get_referrers(target)
+        else:
+            neighbours = gc.get_referents(target)
+        # These only live as long as this call, so don't remember them
+        # in self._ignore, where their IDs might later be reused.
+        transient = {id(neighbours), id(live), id(sys._getframe()),
+                     id(sys._getframe(1))}
+        edges = []
+        added = []
+        skipped = 0
+        for source in neighbours:
+            if (id(source) in self._ignore or id(source) in transient
+                    or (self.filter and not self.filter(source))
+                    or self._is_pruned(source)):
+                continue
+            if len(edges) >= self.too_many:
+                skipped += 1
+                continue
+            if id(source) not in live:
+                self._add(source, self._depth[id(target)] + 1)
+                live[id(source)] = source
+                added.append(id(source))
+            if self.backrefs:
+                label = _edge_label(source, target, self.shortnames)
+            else:
+                label = _edge_label(target, source, self.shortnames)
+            edges.append((id(source), label))
+        source = neighbours = None
+        self._edges[id(target)] = edges
+        self._skipped[id(target)] = skipped
+        return added
 
 
 def show_chain(*chains, **kw):
@@ -841,6 +3333,148 @@ def show_chain(*chains, **kw):
                   filter=in_chains, **kw)
 
 
+def set_repr_limits(maxlen=40, time_limit=None, skip_types=()):
+    """Configure how objects are described in graph node labels.
+
+    Node labels show a shortened ``repr()`` of every object.  Calling the
+    full ``repr()`` of a huge container or of an object with an expensive
+    ``__repr__`` (e.g. an ORM model that lazily loads data) can take a long
+    time, so objgraph uses a bounded repr in the spirit of :mod:`reprlib`:
+    strings, bytes, large integers and nested containers are truncated
+    *before* being converted to text.
+
+    ``maxlen`` limits the length of the repr shown in a label.
+
+    ``time_limit`` is a per-label time budget in seconds.  A ``__repr__``
+    that is already running cannot be interrupted, but once ``repr()`` of
+    some object takes longer than ``time_limit``, all further objects of
+    that type are labelled with just their type name.
+
+    ``skip_types`` is a collection of classes whose ``__repr__`` should
+    never be called; instances of these classes (and their subclasses) are
+    labelled with their type name instead.
+
+    Calling ``set_repr_limits()`` without arguments restores the defaults
+    and forgets which types were found to be slow.
+
+    Example:
+
+        >>> set_repr_limits(time_limit=0.01, skip_types=[MyClass])
+
+    .. versionadded:: 3.7.0
+    """
+    _repr_engine.configure(maxlen, time_limit, skip_types)
+
+
+def describe_chain(chain, shortnames=True):
+    """Describe a list of objects with type names and short reprs.
+
+    Returns a list of ``[type_name, repr]`` pairs, using the same text
+    that :func:`show_refs` and :func:`show_backrefs` would put in node
+    labels.  This is useful for sending the results of
+    :func:`find_backref_chain` out of a process with :func:`in_fork`.
+
+    Example:
+
+        >>> describe_chain(find_backref_chain(obj, is_proper_module))
+        [['module', '__main__'], ['dict', '52 items'], ['MyClass', '<...>']]
+
+    .. versionadded:: 3.7.0
+    """
+    if shortnames:
+        typename = _short_typename
+    else:
+        typename = _long_typename
+    return [[typename(o), _safe_repr(o)] for o in chain]
+
+
+def in_fork(fn, *args, timeout=None, **kwargs):
+    """Call ``fn(*args, **kwargs)`` in a forked child process.
+
+    Analysing a large heap can hold the GIL for seconds.  The child process
+    gets a copy-on-write view of the parent's memory, so it can run the
+    analysis while the parent goes on with its work: the calling thread
+    waits for the result, but without holding the GIL, so the parent's
+    other threads keep serving.
+
+    The child process only has a copy of the calling thread.  Locks that
+    other threads held at the time of the fork (e.g. the locks of logging
+    handlers or of buffered files) stay locked in the child forever, and
+    ``fn`` will deadlock if it needs them.  If ``timeout`` is not None and
+    the child hasn't finished in ``timeout`` seconds, it is killed and
+    ``in_fork`` raises :exc:`TimeoutError`.  (This means ``fn`` cannot get
+    a keyword argument called ``timeout``; use a lambda for that.)
+
+    The return value of ``fn`` must be serializable as JSON (dicts with
+    string keys, lists, strings, numbers, booleans and None); it is sent
+    back to the parent through a pipe and returned.  Note that tuples come
+    back as lists.  Use :func:`describe_chain` to turn object chains into
+    something serializable, and pass a :class:`io.StringIO` as the
+    ``output`` argument of :func:`show_backrefs` to get the graph as text.
+
+    If ``fn`` raises an exception, ``in_fork`` raises RuntimeError with the
+    child's traceback in the message.
+
+    Only available on platforms that support :func:`os.fork`.
+
+    Example:
+
+        >>> in_fork(typestats)
+        {'list': 12041, 'tuple': 10245, ...}
+        >>> in_fork(lambda: describe_chain(
+        ...     find_backref_chain(obj, is_proper_module)))
+        [['module', '__main__'], ['dict', '52 items'], ['MyClass', '<...>']]
+
+    .. versionadded:: 3.7.0
+    """
+    # Don't let the child flush the parent's buffered output a second time
+    sys.stdout.flush()
+    sys.stderr.flush()
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: nocover -- the child process
+        os.close(r)
+        try:
+            try:
+                response = json.dumps({'result': fn(*args, **kwargs)})
+            except BaseException:
+                response = json.dumps({'error': traceback.format_exc()})
+            with os.fdopen(w, 'w', encoding='utf-8') as f:
+                f.write(response)
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(0)
+    os.close(w)
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+    chunks = []
+    try:
+        while True:
+            if timeout is not None:
+                remaining = max(deadline - time.monotonic(), 0)
+                if not select.select([r], [], [], remaining)[0]:
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                    raise TimeoutError('child process %d did not finish in'
+                                       ' %g seconds' % (pid, timeout))
+            chunk = os.read(r, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(r)
+    os.waitpid(pid, 0)
+    response = b''.join(chunks).decode('utf-8')
+    if not response:
+        raise RuntimeError('child process %d exited without a result' % pid)
+    response = json.loads(response)
+    if 'error' in response:
+        raise RuntimeError('child process %d failed:\n%s'
+                           % (pid, response['error']))
+    return response['result']
+
+
 def is_proper_module(obj):
     """
     Returns ``True`` if ``obj`` can be treated like a garbage collector root.
@@ -867,6 +3501,51 @@ def is_proper_module(obj):
 # Internal helpers
 #
 
+# Objects registered with track(): id(weakref) -> (weakref, label, birth)
+_tracked = {}
+# Lifetimes of freed tracked objects: label -> [count for each bucket]
+_tracked_lifetimes = {}
+_LIFETIME_BUCKETS = (0.001, 0.01, 0.1, 1, 10, 60, 600, 3600, float('inf'))
+
+
+def _tracked_object_died(ref):
+    entry = _tracked.pop(id(ref), None)
+    if entry is None:  # pragma: nocover
+        return
+    ref, label, birth = entry
+    lifetime = time.monotonic() - birth
+    counts = _tracked_lifetimes.setdefault(label,
+                                           [0] * len(_LIFETIME_BUCKETS))
+    counts[bisect.bisect_left(_LIFETIME_BUCKETS, lifetime)] += 1
+
+
+# Instances of classes decorated with count_instances()
+_counted = {}  # id(obj) -> _CountedRef
+_instance_counts = {}  # type -> number of live instances
+# Nothing that runs while this is held may free an object or allocate one
+# tracked by the GC, or a weakref callback could try to take it again.
+_instance_counts_lock = threading.Lock()
+
+
+class _CountedRef(weakref.ref):
+    __slots__ = ('objtype', 'key')
+
+    def __init__(self, obj, callback):
+        super().__init__(obj, callback)
+        self.objtype = type(obj)
+        self.key = id(obj)
+
+
+def _counted_instance_died(ref):
+    with _instance_counts_lock:
+        del _counted[ref.key]
+        n = _instance_counts[ref.objtype] - 1
+        if n:
+            _instance_counts[ref.objtype] = n
+        else:
+            del _instance_counts[ref.objtype]
+
+
 def _find_chain(obj, predicate, edge_func, max_depth=20, extra_ignore=()):
     queue = [obj]
     depth = {id(obj): 0}
@@ -902,34 +3581,206 @@ def _find_chain(obj, predicate, edge_func, max_depth=20, extra_ignore=()):
     return [obj]  # not found
 
 
+def _strongly_connected_components(objects):
+    """Find reference cycles in a list of objects.
+
+    Returns a list of components, each one a list of indices into
+    ``objects``.  Components of a single object are only included if the
+    object refers to itself.
+
+    This is Tarjan's algorithm, converted to use an explicit stack.
+    """
+    index_of = {id(o): i for i, o in enumerate(objects)}
+    n = len(objects)
+    index = array.array('q', [-1]) * n
+    lowlink = array.array('q', [0]) * n
+    on_stack = bytearray(n)
+    self_loop = bytearray(n)
+    stack = []
+    components = []
+    counter = 0
+
+    def successors(v):
+        result = [index_of[id(o)] for o in gc.get_referents(objects[v])
+                  if id(o) in index_of]
+        if v in result:
+            self_loop[v] = 1
+        return iter(result)
+
+    for start in range(n):
+        if index[start] >= 0:
+            continue
+        index[start] = lowlink[start] = counter
+        counter += 1
+        stack.append(start)
+        on_stack[start] = 1
+        work = [(start, successors(start))]
+        while work:
+            v, it = work[-1]
+            for w in it:
+                if index[w] < 0:
+                    index[w] = lowlink[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = 1
+                    work.append((w, successors(w)))
+                    break
+                elif on_stack[w] and index[w] < lowlink[v]:
+                    lowlink[v] = index[w]
+            else:
+                work.pop()
+                if work and lowlink[v] < lowlink[work[-1][0]]:
+                    lowlink[work[-1][0]] = lowlink[v]
+                if lowlink[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = 0
+                        component.append(w)
+                        if w == v:
+                            break
+                    if len(component) > 1 or self_loop[v]:
+                        component.reverse()
+                        components.append(component)
+    return components
+
+
+# typestats() doesn't start threads for fewer objects than this.
+_PARALLEL_TYPESTATS_MIN = 100000
+
+
+def _gil_enabled():
+    # sys._is_gil_enabled() is new in Python 3.13.
+    return getattr(sys, '_is_gil_enabled', lambda: True)()
+
+
+def _parallel_typestats(objects, typename, filter, threads):
+    import concurrent.futures
+
+    def count(start, stop):
+        chunk = objects[start:stop]
+        if filter:
+            chunk = (o for o in chunk if filter(o))
+        return collections.Counter(map(typename, chunk))
+
+    step = -(-len(objects) // threads)
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        futures = [executor.submit(count, start, start + step)
+                   for start in range(0, len(objects), step)]
+        stats = collections.Counter()
+        for future in futures:
+            stats.update(future.result())
+    return dict(stats)
+
+
+def _typestats_and_sizes(objects, typename, filter=None):
+    counts = {}
+    sizes = {}
+    for o in objects:
+        if filter and not filter(o):
+            continue
+        n = typename(o)
+        counts[n] = counts.get(n, 0) + 1
+        sizes[n] = sizes.get(n, 0) + sys.getsizeof(o, 0)
+    return counts, sizes
+
+
+def _encode_varint(buf, n):
+    while n >= 0x80:
+        buf.append(n & 0x7F | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def _decode_varint(data, pos):
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _zigzag(n):
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+
+def _unzigzag(n):
+    return n // 2 if not n & 1 else -(n + 1) // 2
+
+
+def _mark_reachable(roots, seen, found=None, stop=()):
+    """Mark objects reachable from ``roots``.
+
+    Adds the IDs of all objects that can be reached from ``roots`` by
+    following :func:`gc.get_referents` to the ``seen`` set, without going
+    through objects that are in ``seen`` or ``stop`` already.  If ``found``
+    is not None, it should be a dictionary, and newly seen objects are
+    added to it, keyed by ID.
+    """
+    stack = list(roots)
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or id(o) in stop:
+            continue
+        seen.add(id(o))
+        if found is not None:
+            found[id(o)] = o
+        stack.extend(_referents(o, follow_types=True))
+    o = None
+
+
+_TPFLAGS_HEAPTYPE = 1 << 9
+
+
+def _referents(obj, follow_types=False):
+    """Return the objects that ``obj`` refers to.
+
+    Like :func:`gc.get_referents`, but also looks inside code objects,
+    which are not tracked by the GC and don't report their referents.
+
+    If ``follow_types`` is true, also returns the type of ``obj`` and,
+    for static types (which include most builtin types), their
+    ``__dict__``, ``__mro__`` and static subclasses, since neither the
+    types nor their instances report those.
+    """
+    referents = gc.get_referents(obj)
+    if follow_types:
+        referents.append(type(obj))
+    if (follow_types and _isinstance(obj, type)
+            and not obj.__flags__ & _TPFLAGS_HEAPTYPE):
+        referents.extend(gc.get_referents(vars(obj)))  # the real __dict__
+        referents.append(obj.__mro__)
+        # Some static types are only known to their base classes.
+        referents.extend(t for t in type.__subclasses__(obj)
+                         if not t.__flags__ & _TPFLAGS_HEAPTYPE)
+    elif _isinstance(obj, types.CodeType):
+        referents += [obj.co_consts, obj.co_names, obj.co_filename,
+                      obj.co_name, obj.co_linetable]
+        # Since Python 3.11 co_varnames, co_cellvars and co_freevars make
+        # a new tuple on every access, so take only the names in them.
+        referents.extend(obj.co_varnames)
+        referents.extend(obj.co_cellvars)
+        referents.extend(obj.co_freevars)
+        if sys.version_info < (3, 11):  # pragma: nocover
+            # Newer versions keep the bytecode inside the code object, and
+            # co_code makes a copy.
+            referents.append(obj.co_code)
+    return referents
+
+
 def _show_graph(objs, edge_func, swap_source_target,
                 max_depth=3, extra_ignore=(), filter=None, too_many=10,
                 highlight=None, filename=None, extra_info=None,
                 refcounts=False, shortnames=True, output=None,
-                cull_func=None, extra_node_attrs=None):
+                cull_func=None, extra_node_attrs=None, max_nodes=None,
+                max_edges=None, time_limit=None, compact=False):
     if not _isinstance(objs, (list, tuple)):
         objs = [objs]
 
-    is_interactive = False
-    if filename and output:
-        raise ValueError('Cannot specify both output and filename.')
-    elif output:
-        f = output
-    elif filename and filename.endswith('.dot'):
-        f = codecs.open(filename, 'w', encoding='utf-8')
-        dot_filename = filename
-    elif IS_INTERACTIVE and not filename:
-        is_interactive = True
-        f = StringIO()
-    else:
-        fd, dot_filename = tempfile.mkstemp(prefix='objgraph-',
-                                            suffix='.dot', text=True)
-        f = os.fdopen(fd, "w")
-        if getattr(f, 'encoding', None):  # pragma: PY3
-            # Python 3 will wrap the file in the user's preferred encoding
-            # Re-wrap it for utf-8
-            import io
-            f = io.TextIOWrapper(f.detach(), 'utf-8')
+    f, dot_filename = _open_graph_output(filename, output)
     f.write('digraph ObjectGraph {\n'
             '  node[shape=box, style=filled, fillcolor=white];\n')
     queue = []
@@ -950,8 +3801,18 @@ def _show_graph(objs, edge_func, swap_source_target,
         queue.append(obj)
         del obj
     gc.collect()
+    start_time = time.perf_counter()
     nodes = 0
+    edges = 0
+    truncated = []
     while queue:
+        if max_nodes is not None and nodes >= max_nodes:
+            truncated = queue
+            break
+        if (time_limit is not None
+                and time.perf_counter() - start_time > time_limit):
+            truncated = queue
+            break
         nodes += 1
         # The names "source" and "target" are reversed here because
         # originally there was just show_backrefs() and we were
@@ -988,9 +3849,13 @@ def _show_graph(objs, edge_func, swap_source_target,
             continue
         neighbours = edge_func(target)
         ignore.add(id(neighbours))
+        if compact:
+            neighbours, labels = _compact_neighbours(
+                target, neighbours, edge_func, swap_source_target, ignore,
+                shortnames, filter, too_many)
         n = 0
         skipped = 0
-        for source in neighbours:
+        for i, source in enumerate(neighbours):
             if id(source) in ignore:
                 continue
             if filter and not filter(source):
@@ -998,19 +3863,29 @@ def _show_graph(objs, edge_func, swap_source_target,
             if n >= too_many:
                 skipped += 1
                 continue
+            if max_edges is not None and edges >= max_edges:
+                truncated = [target] + queue
+                break
             if swap_source_target:
                 srcnode, tgtnode = target, source
             else:
                 srcnode, tgtnode = source, target
-            elabel = _edge_label(srcnode, tgtnode, shortnames)
+            if compact:
+                elabel = labels[i]
+            else:
+                elabel = _edge_label(srcnode, tgtnode, shortnames)
             f.write('  %s -> %s%s;\n' % (_obj_node_id(srcnode),
                                          _obj_node_id(tgtnode), elabel))
             if id(source) not in depth:
                 depth[id(source)] = tdepth + 1
                 queue.append(source)
             n += 1
+            edges += 1
             del source
+        source = None
         del neighbours
+        if truncated:
+            break
         if skipped > 0:
             h, s, v = _gradient((0, 1, 1), (0, 1, .3), tdepth + 1, max_depth)
             if swap_source_target:
@@ -1028,18 +3903,69 @@ def _show_graph(objs, edge_func, swap_source_target,
                     % (_obj_node_id(target), label, h, s, v))
             f.write('  too_many_%s[fontcolor=white];\n'
                     % (_obj_node_id(target)))
+    for target in truncated:
+        f.write('  %s[label="%s"%s];\n' % (_obj_node_id(target),
+                                           _obj_label(target, extra_info,
+                                                      refcounts, shortnames),
+                                           _obj_attrs(target,
+                                                      extra_node_attrs)))
+        f.write('  %s[color=red,style="filled,dashed"];\n'
+                % (_obj_node_id(target)))
+    truncated_nodes = len(truncated)
+    target = truncated = None
     f.write("}\n")
+    if truncated_nodes:
+        summary = "%d nodes, truncated" % nodes
+    else:
+        summary = "%d nodes" % nodes
+    return _close_graph_output(f, dot_filename, filename, output, summary)
+
+
+def _open_graph_output(filename=None, output=None):
+    """Open the file that a graph should be written to.
+
+    Returns the file and the name of the .dot file, which is None if the
+    graph is written to ``output`` or displayed inline in IPython.
+    """
+    dot_filename = None
+    if filename and output:
+        raise ValueError('Cannot specify both output and filename.')
+    elif output:
+        f = output
+    elif filename and filename.endswith('.dot'):
+        f = codecs.open(filename, 'w', encoding='utf-8')
+        dot_filename = filename
+    elif IS_INTERACTIVE and not filename:
+        f = StringIO()
+    else:
+        fd, dot_filename = tempfile.mkstemp(prefix='objgraph-',
+                                            suffix='.dot', text=True)
+        f = os.fdopen(fd, "w")
+        if getattr(f, 'encoding', None):  # pragma: PY3
+            # Python 3 will wrap the file in the user's preferred encoding
+            # Re-wrap it for utf-8
+            import io
+            f = io.TextIOWrapper(f.detach(), 'utf-8')
+    return f, dot_filename
+
 
+def _close_graph_output(f, dot_filename, filename=None, output=None,
+                        summary=''):
+    """Finish writing a graph opened by :func:`_open_graph_output`.
+
+    Returns a ``graphviz.Source`` when the graph is displayed inline in
+    IPython, otherwise presents the .dot file to the user.
+    """
     if output:
         return
 
-    if is_interactive:
+    if dot_filename is None:
         return graphviz.Source(f.getvalue())
     else:
         # The file should only be closed if this function was in charge of
         # opening the file.
         f.close()
-        print("Graph written to %s (%d nodes)" % (dot_filename, nodes))
+        print("Graph written to %s (%s)" % (dot_filename, summary))
         _present_graph(dot_filename, filename)
 
 
@@ -1082,7 +4008,11 @@ def _present_graph(dot_filename, filename=None):
 
 
 def _obj_node_id(obj):
-    return ('o%d' % id(obj)).replace('-', '_')
+    return _node_id(id(obj))
+
+
+def _node_id(id_number):
+    return ('o%d' % id_number).replace('-', '_')
 
 
 def _obj_attrs(obj, extra_node_attrs):
@@ -1096,10 +4026,7 @@ def _obj_attrs(obj, extra_node_attrs):
 
 
 def _obj_label(obj, extra_info=None, refcounts=False, shortnames=True):
-    if shortnames:
-        label = [_short_typename(obj)]
-    else:
-        label = [_long_typename(obj)]
+    label = _obj_label_lines(obj, extra_info, shortnames)
     if refcounts:
         label[0] += ' [%d]' % (sys.getrefcount(obj) - 4)
         # Why -4?  To ignore the references coming from
@@ -1107,10 +4034,18 @@ def _obj_label(obj, extra_info=None, refcounts=False, shortnames=True):
         #   show_graph's frame (target variable)
         #   sys.getrefcount()'s argument
         #   something else that doesn't show up in gc.get_referrers()
+    return _quote('\n'.join(label))
+
+
+def _obj_label_lines(obj, extra_info=None, shortnames=True):
+    if shortnames:
+        label = [_short_typename(obj)]
+    else:
+        label = [_long_typename(obj)]
     label.append(_safe_repr(obj))
     if extra_info:
         label.append(str(extra_info(obj)))
-    return _quote('\n'.join(label))
+    return label
 
 
 def _quote(s):
@@ -1130,7 +4065,10 @@ def _short_typename(obj):
 
 
 def _long_typename(obj):
-    objtype = _get_obj_type(obj)
+    return _long_typename_of_type(_get_obj_type(obj))
+
+
+def _long_typename_of_type(objtype):
     name = objtype.__name__
     module = getattr(objtype, '__module__', None)
     if module:
@@ -1139,6 +4077,61 @@ def _long_typename(obj):
         return name
 
 
+class _BoundedRepr(reprlib.Repr):
+    """A repr() that avoids producing more text than it will show."""
+
+    def __init__(self):
+        super().__init__()
+        self.configure()
+
+    def configure(self, maxlen=40, time_limit=None, skip_types=()):
+        self.maxlen = maxlen
+        self.maxstring = self.maxlong = self.maxother = maxlen
+        self.maxlevel = 2
+        self.time_limit = time_limit
+        self.skip_types = tuple(skip_types)
+        self.slow_types = set()
+
+    def repr1(self, x, level):
+        # reprlib picks the repr_<type name> method by the name alone, so
+        # an unrelated class that happens to be called e.g. str or int
+        # would end up in the methods below.
+        if type(x).__module__ not in ('builtins', 'array', 'collections'):
+            return self.repr_instance(x, level)
+        return super().repr1(x, level)
+
+    def repr_str(self, x, level):
+        return repr(x[:self.maxstring])
+
+    repr_bytes = repr_str
+
+    def repr_int(self, x, level):
+        # Converting huge integers to decimal takes quadratic time (and
+        # may raise ValueError because of sys.set_int_max_str_digits())
+        if x.bit_length() > self.maxlong * 4:
+            return '<int with %d bits>' % x.bit_length()
+        return repr(x)
+
+    def repr_instance(self, x, level):
+        return repr(x)
+
+    def __call__(self, obj):
+        objtype = type(obj)
+        if objtype in self.slow_types or issubclass(objtype, self.skip_types):
+            return '<%s>' % objtype.__name__
+        if self.time_limit is None:
+            return self.repr(obj)[:self.maxlen]
+        start = time.perf_counter()
+        try:
+            return self.repr(obj)[:self.maxlen]
+        finally:
+            if time.perf_counter() - start > self.time_limit:
+                self.slow_types.add(objtype)
+
+
+_repr_engine = _BoundedRepr()
+
+
 def _safe_repr(obj):
     try:
         return _short_repr(obj)
@@ -1150,12 +4143,12 @@ def _name_or_repr(value):
     try:
         result = value.__name__
     except AttributeError:
-        result = repr(value)[:40]
+        result = _repr_engine(value)
 
     if _isinstance(result, str):
         return result
     else:
-        return repr(value)[:40]
+        return _repr_engine(value)
 
 
 def _short_repr(obj):
@@ -1176,7 +4169,7 @@ def _short_repr(obj):
         return '%s:%s' % (obj.f_code.co_filename, obj.f_lineno)
     if _isinstance(obj, (tuple, list, dict, set)):
         return '%d items' % len(obj)
-    return repr(obj)[:40]
+    return _repr_engine(obj)
 
 
 def _gradient(start_color, end_color, depth, max_depth):
@@ -1193,42 +4186,183 @@ def _gradient(start_color, end_color, depth, max_depth):
 
 
 def _edge_label(source, target, shortnames=True):
+    return _format_edge_label(*_edge_label_parts(source, target, shortnames))
+
+
+def _format_edge_label(label, weight):
+    if not label:
+        return ''
+    if weight is None:
+        return ' [label="%s"]' % _quote(label)
+    return ' [label="%s",weight=%d]' % (_quote(label), weight)
+
+
+def _edge_label_parts(source, target, shortnames=True):
     if (_isinstance(target, dict)
             and target is getattr(source, '__dict__', None)):
-        return ' [label="__dict__",weight=10]'
+        return '__dict__', 10
     if _isinstance(source, types.FrameType):
         if target is source.f_locals:  # pragma: nocover
-            return ' [label="f_locals",weight=10]'
+            return 'f_locals', 10
         if target is source.f_globals:
-            return ' [label="f_globals",weight=10]'
+            return 'f_globals', 10
     if _isinstance(source, types.MethodType):
         try:
             if target is source.__self__:
-                return ' [label="__self__",weight=10]'
+                return '__self__', 10
             if target is source.__func__:
-                return ' [label="__func__",weight=10]'
+                return '__func__', 10
         except AttributeError:  # pragma: nocover
             # Python < 2.6 compatibility
             if target is source.im_self:
-                return ' [label="im_self",weight=10]'
+                return 'im_self', 10
             if target is source.im_func:
-                return ' [label="im_func",weight=10]'
+                return 'im_func', 10
     if _isinstance(source, types.FunctionType):
         for k in dir(source):
             if target is getattr(source, k):
-                return ' [label="%s",weight=10]' % _quote(k)
+                return k, 10
     if _isinstance(source, dict):
         for k, v in source.items():
             if v is target:
                 if _isinstance(k, str) and _is_identifier(k):
-                    return ' [label="%s",weight=2]' % _quote(k)
+                    return k, 2
                 else:
                     if shortnames:
                         tn = _short_typename(k)
                     else:
                         tn = _long_typename(k)
-                    return ' [label="%s"]' % _quote(tn + "\n" + _safe_repr(k))
-    return ''
+                    return tn + "\n" + _safe_repr(k), None
+    return '', None
+
+
+def _compact_neighbours(target, neighbours, edge_func, swap_source_target,
+                        ignore, shortnames, filter=None, too_many=None):
+    """Skip over the objects that compact graphs leave out.
+
+    Returns a list of the objects that should be drawn as ``target``'s
+    neighbours, and a list of the edge labels for them.  Instance
+    dictionaries, frame ``f_locals`` and bound methods are replaced with
+    their own neighbours, and the labels of the edges through them are
+    joined with dots, leaving out ``__dict__`` and ``f_locals``, and given
+    the largest of their weights.
+
+    Once ``too_many`` neighbours that pass ``filter`` have been found, the
+    rest are returned as they are, since they will only be counted.  When
+    following referrers, the owners of the dicts are looked up with one
+    call to ``edge_func`` for all the dicts that can still be drawn,
+    because every call is a scan of the whole heap.
+    """
+    result = []
+    labels = []
+    # These are parallel stacks instead of a stack of tuples so they don't
+    # show up as referrers when edge_func is gc.get_referrers.
+    pending = list(reversed(neighbours))
+    prevs = [target] * len(pending)
+    paths = [()] * len(pending)
+    seen = {id(target)}
+    # The referrers of dicts, by ID, looked up a batch at a time.
+    referrers_of = {}
+    drawn = 0
+    collapsed = ('__dict__', 'f_locals')
+    ignore.update(map(id, [result, labels, pending, prevs, paths,
+                           referrers_of]))
+    ignore.add(id(sys._getframe()))   # this function
+    while pending:
+        node = pending.pop()
+        prev = prevs.pop()
+        path = paths.pop()
+        if id(node) in ignore or id(node) in seen:
+            continue
+        if too_many is not None and drawn >= too_many:
+            result.append(node)
+            labels.append('')
+            continue
+        if swap_source_target:
+            label, weight = _edge_label_parts(prev, node, shortnames)
+        else:
+            label, weight = _edge_label_parts(node, prev, shortnames)
+        if not label or label in collapsed:
+            pass
+        elif swap_source_target:
+            path += ((label, weight), )
+        else:
+            path = ((label, weight), ) + path
+        expand = None
+        if _isinstance(node, types.MethodType):
+            expand = edge_func(node)
+        elif _isinstance(node, dict):
+            if swap_source_target:
+                if label in collapsed:
+                    expand = edge_func(node)
+            else:
+                if id(node) not in referrers_of:
+                    _find_referrers_of_dicts(
+                        node, pending, edge_func, ignore, seen,
+                        referrers_of,
+                        None if too_many is None else too_many - drawn)
+                referrers = referrers_of.pop(id(node))
+                for owner in referrers:
+                    if (id(owner) not in ignore
+                            and _edge_label_parts(owner, node)[0]
+                            in collapsed):
+                        expand = referrers
+                        break
+                owner = referrers = None
+        if expand is None:
+            if not filter or filter(node):
+                drawn += 1
+            result.append(node)
+            labels.append(_format_edge_label(
+                '.'.join(label for label, weight in path),
+                max([weight for label, weight in path
+                     if weight is not None] or [None])))
+            continue
+        seen.add(id(node))
+        ignore.add(id(expand))
+        for n in reversed(expand):
+            pending.append(n)
+            prevs.append(node)
+            paths.append(path)
+        n = expand = None
+    node = prev = None
+    return result, labels
+
+
+def _find_referrers_of_dicts(node, pending, edge_func, ignore, seen,
+                             referrers_of, limit):
+    """Look up the referrers of ``node`` and the dicts in ``pending``.
+
+    Takes the dicts from the top of the ``pending`` stack, up to ``limit``
+    of them in all, and stores a list of referrers for each of them in
+    ``referrers_of``, by ID, with a single call to ``edge_func``.
+    """
+    dicts = [node]
+    wanted = {id(node)}
+    for o in reversed(pending):
+        if limit is not None and len(dicts) >= limit:
+            break
+        if (_isinstance(o, dict) and id(o) not in ignore
+                and id(o) not in seen and id(o) not in referrers_of
+                and id(o) not in wanted):
+            dicts.append(o)
+            wanted.add(id(o))
+    o = None
+    ignore.add(id(dicts))
+    ignore.add(id(sys._getframe()))   # this function
+    for i in wanted:
+        referrers_of[i] = []
+        ignore.add(id(referrers_of[i]))
+    referrers = edge_func(*dicts)
+    del dicts[:]
+    ignore.add(id(referrers))
+    for r in referrers:
+        # The objects among them that refer to each dict are its referrers,
+        # which gc.get_referents() can tell without another heap scan.
+        for o in gc.get_referents(r):
+            if id(o) in wanted:
+                referrers_of[id(o)].append(r)
+    o = r = referrers = None
 
 
 _is_identifier = re.compile('[a-zA-Z_][a-zA-Z_0-9]*$').match
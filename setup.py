@@ -89,6 +89,9 @@ setup(
         'ipython': [
             'graphviz',  # just for ipython support currently
         ],
+        'numpy': [
+            'numpy',  # for faster Snapshot analysis
+        ],
         'test': [],
     },
     zip_safe=True,
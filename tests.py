@@ -1,16 +1,26 @@
 #!/usr/bin/python
+import ctypes
 import doctest
 import gc
 import glob
+import importlib.util
+import json
 import os
 import re
 import shutil
+import socket
 import string
+import struct
+import subprocess
 import sys
 import tempfile
 import textwrap
+import threading
+import time
+import tracemalloc
 import types
 import unittest
+import weakref
 from io import StringIO
 from unittest import mock, skipIf
 
@@ -194,6 +204,50 @@ class ShowGraphTest(unittest.TestCase):
                                 label_a=label_a,
                                 label_b=label_b))
 
+    def test_max_nodes(self):
+        edge_fn = edge_function({'A': ['B', 'C'], 'B': 'D'})
+        output = StringIO()
+        objgraph._show_graph([TestObject.get("A")], edge_fn, False,
+                             output=output, shortnames=True, max_nodes=1)
+        output_value = output.getvalue()
+        for name in 'BC':
+            label = objgraph._obj_node_id(TestObject.get(name))
+            self.assertIn('%s[color=red,style="filled,dashed"]' % label,
+                          output_value)
+        self.assertNotIn(objgraph._obj_node_id(TestObject.get("D")),
+                         output_value)
+
+    def test_max_edges(self):
+        edge_fn = edge_function({'A': ['B', 'C']})
+        output = StringIO()
+        objgraph._show_graph([TestObject.get("A")], edge_fn, False,
+                             output=output, shortnames=True, max_edges=1)
+        output_value = output.getvalue()
+        self.assertEqual(1, output_value.count(' -> '))
+        label_a = objgraph._obj_node_id(TestObject.get("A"))
+        self.assertIn('%s[color=red,style="filled,dashed"]' % label_a,
+                      output_value)
+
+    @mock.patch('objgraph._present_graph')
+    def test_truncated_message(self, mock_present_graph):
+        edge_fn = edge_function({'A': 'B'})
+        with mock.patch('sys.stdout', StringIO()) as stdout:
+            objgraph._show_graph([TestObject.get("A")], edge_fn, False,
+                                 shortnames=True, max_nodes=1)
+        dot_filename = mock_present_graph.call_args[0][0]
+        os.unlink(dot_filename)
+        self.assertEqual('Graph written to %s (1 nodes, truncated)\n'
+                         % dot_filename, stdout.getvalue())
+
+    def test_time_limit(self):
+        edge_fn = edge_function({'A': 'B'})
+        output = StringIO()
+        objgraph._show_graph([TestObject.get("A")], edge_fn, False,
+                             output=output, shortnames=True, time_limit=-1)
+        label_a = objgraph._obj_node_id(TestObject.get("A"))
+        self.assertIn('%s[color=red,style="filled,dashed"]' % label_a,
+                      output.getvalue())
+
     @mock.patch('objgraph.IS_INTERACTIVE', True)
     @mock.patch('objgraph.graphviz', create=True)
     def test_ipython(self, mock_graphviz):
@@ -203,6 +257,286 @@ class ShowGraphTest(unittest.TestCase):
         self.assertTrue(res.startswith('digraph'))
 
 
+class ShowTypeGraphTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for the show_type_graph function."""
+
+    def setUp(self):
+        super(ShowTypeGraphTest, self).setUp()
+        self.Parent = type('Parent', (), {'__module__': 'mymodule',
+                                          '__slots__': ('children', )})
+        self.Child = type('Child', (), {'__module__': 'mymodule',
+                                        '__slots__': ()})
+        self.parents = [self.Parent() for n in range(3)]
+        for parent in self.parents:
+            parent.children = [self.Child() for n in range(1000)]
+
+    def show_type_graph(self, **kw):
+        output = StringIO()
+        objgraph.show_type_graph(output=output, **kw)
+        return output.getvalue()
+
+    def edge_count(self, output, source, target):
+        ids = dict(re.findall(r'(t\d+)\[label="([^"]*)"\]', output))
+        names = {name: node for node, name in ids.items()}
+        match = re.search(r'%s -> %s \[label="(\d+)"'
+                          % (names[source], names[target]), output)
+        return int(match.group(1))
+
+    def test_show_type_graph(self):
+        output = self.show_type_graph(min_count=1000)
+        self.assertTrue(output.startswith('digraph TypeGraph {'))
+        self.assertGreaterEqual(self.edge_count(output, 'list', 'Child'),
+                                3000)
+        self.assertNotIn('"Parent"', output)
+
+    def test_min_count(self):
+        output = self.show_type_graph(min_count=3)
+        self.assertEqual(3, self.edge_count(output, 'Parent', 'list'))
+
+    def test_long_type_names(self):
+        output = self.show_type_graph(min_count=3, shortnames=False)
+        self.assertEqual(3, self.edge_count(output, 'mymodule.Parent',
+                                            'builtins.list'))
+
+    def test_filter(self):
+        output = self.show_type_graph(
+            min_count=1, filter=lambda o: type(o) is self.Parent)
+        self.assertEqual(3, self.edge_count(output, 'Parent', 'list'))
+        self.assertNotIn('"Child"', output)
+
+    @mock.patch('objgraph._present_graph')
+    def test_filename(self, mock_present_graph):
+        with mock.patch('sys.stdout', StringIO()) as stdout:
+            objgraph.show_type_graph(
+                min_count=1, filter=lambda o: type(o) is self.Parent)
+        dot_filename = mock_present_graph.call_args[0][0]
+        os.unlink(dot_filename)
+        self.assertEqual('Graph written to %s (3 nodes, 2 edges)\n'
+                         % dot_filename, stdout.getvalue())
+
+
+class CompactGraphTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for show_refs and show_backrefs with compact=True."""
+
+    def setUp(self):
+        super(CompactGraphTest, self).setUp()
+        self.MyClass = type('MyClass', (), {
+            '__module__': 'mymodule', 'method': lambda self: None})
+        self.obj = self.MyClass()
+        # Make sure the instance has a real __dict__ on Python 3.11+.
+        self.obj.__dict__['value'] = self.value = ['value']
+
+    def edge(self, source, target, label):
+        return '  %s -> %s [label="%s",weight=%d];\n' % (
+            objgraph._obj_node_id(source), objgraph._obj_node_id(target),
+            label, 10 if '__' in label else 2)
+
+    def test_show_refs(self):
+        output = StringIO()
+        objgraph.show_refs([self.obj], max_depth=1, compact=True,
+                           output=output)
+        output = output.getvalue()
+        self.assertIn(self.edge(self.obj, self.value, 'value'), output)
+        self.assertNotIn(objgraph._obj_node_id(self.obj.__dict__), output)
+
+    def test_show_refs_bound_method(self):
+        holder = {'callback': self.obj.method}
+        output = StringIO()
+        objgraph.show_refs([holder], max_depth=1, compact=True,
+                           output=output)
+        output = output.getvalue()
+        self.assertIn(self.edge(holder, self.obj, 'callback.__self__'),
+                      output)
+        self.assertIn(self.edge(holder, self.MyClass.method,
+                                'callback.__func__'), output)
+
+    def test_show_refs_not_compact(self):
+        output = StringIO()
+        objgraph.show_refs([self.obj], max_depth=1, output=output)
+        self.assertIn(objgraph._obj_node_id(self.obj.__dict__),
+                      output.getvalue())
+
+    def test_show_backrefs(self):
+        output = StringIO()
+        objgraph.show_backrefs([self.value], max_depth=1, compact=True,
+                               output=output)
+        output = output.getvalue()
+        self.assertIn(self.edge(self.obj, self.value, 'value'), output)
+        self.assertNotIn(objgraph._obj_node_id(self.obj.__dict__), output)
+
+    def test_show_backrefs_bound_method(self):
+        holder = {'callback': self.obj.method}
+        output = StringIO()
+        objgraph.show_backrefs([self.obj], max_depth=1, compact=True,
+                               output=output)
+        self.assertIn(self.edge(holder, self.obj, 'callback.__self__'),
+                      output.getvalue())
+
+    def test_show_backrefs_heap_scans(self):
+        holders = [{'value': self.value} for i in range(30)]
+        calls = []
+
+        def get_referrers(*objs):
+            calls.append(len(objs))
+            return original(*objs)
+
+        original = gc.get_referrers
+        output = StringIO()
+        with mock.patch('gc.get_referrers', get_referrers):
+            objgraph.show_backrefs([self.value], max_depth=1, compact=True,
+                                   output=output)
+        # One scan for the referrers of the value, and one for the owners
+        # of no more dicts than will be drawn.
+        self.assertEqual(2, len(calls))
+        self.assertLessEqual(calls[1], 10)
+        self.assertIn(self.edge(self.obj, self.value, 'value'),
+                      output.getvalue())
+        self.assertIn('more backreferences', output.getvalue())
+        del holders
+
+    def test_show_backrefs_plain_dict(self):
+        holder = {'value': self.value}
+        output = StringIO()
+        objgraph.show_backrefs([self.value], max_depth=1, compact=True,
+                               output=output)
+        self.assertIn(self.edge(holder, self.value, 'value'),
+                      output.getvalue())
+
+
+class GraphSessionTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for the GraphSession class."""
+
+    def setUp(self):
+        super(GraphSessionTest, self).setUp()
+        self.MyClass = type('MyClass', (), {'__module__': 'mymodule'})
+        self.calls = []
+
+    def count_calls(self, fn):
+        def wrapper(*args, **kw):
+            self.calls.append(fn.__name__)
+            return fn(*args, **kw)
+        return wrapper
+
+    def show(self, session):
+        output = StringIO()
+        session.show(output=output)
+        return output.getvalue()
+
+    def test_deepen(self):
+        obj = self.MyClass()
+        holder = [obj]
+        outer = {'holder': holder}
+        with mock.patch('gc.get_referrers',
+                        self.count_calls(gc.get_referrers)):
+            session = objgraph.GraphSession(obj, max_depth=1)
+            self.assertEqual([], self.calls)
+            output = self.show(session)
+            self.assertIn(objgraph._obj_node_id(holder), output)
+            self.assertNotIn(objgraph._obj_node_id(outer), output)
+            self.assertEqual(1, len(self.calls))
+            session.deepen()
+        output = self.show(session)
+        self.assertIn('  %s -> %s [label="holder",weight=2];\n'
+                      % (objgraph._obj_node_id(outer),
+                         objgraph._obj_node_id(holder)), output)
+        self.assertEqual(2, len(self.calls))
+
+    def test_expand(self):
+        obj = self.MyClass()
+        holder = [obj]
+        session = objgraph.GraphSession(obj, max_depth=0)
+        self.assertNotIn(objgraph._obj_node_id(holder), self.show(session))
+        with mock.patch('gc.get_referrers',
+                        self.count_calls(gc.get_referrers)):
+            session.expand(obj)
+            session.expand(obj)
+        self.assertIn(objgraph._obj_node_id(holder), self.show(session))
+        self.assertEqual(1, len(self.calls))
+        self.assertRaises(ValueError, session.expand, self.MyClass())
+
+    def test_backrefs_stop_at_modules(self):
+        obj = self.MyClass()
+        module = types.ModuleType('mymodule')
+        module.obj = obj
+        expanded = []
+
+        def get_referrers(*objs):
+            expanded.extend(objs)
+            return original(*objs)
+
+        original = gc.get_referrers
+        session = objgraph.GraphSession(obj, max_depth=5)
+        with mock.patch.dict(sys.modules, mymodule=module), \
+                mock.patch('gc.get_referrers', get_referrers):
+            output = self.show(session)
+        self.assertIn(objgraph._obj_node_id(module), output)
+        self.assertFalse(any(o is module for o in expanded))
+
+    def test_labels_are_reused(self):
+        obj = self.MyClass()
+        holder = [obj]
+        session = objgraph.GraphSession(obj, max_depth=1)
+        with mock.patch('objgraph._obj_label',
+                        self.count_calls(objgraph._obj_label)):
+            first = self.show(session)
+            self.assertEqual(2, len(self.calls))
+            second = self.show(session)
+        self.assertEqual(2, len(self.calls))
+        self.assertEqual(first, second)
+        del holder
+
+    def test_prune(self):
+        obj = self.MyClass()
+        holder = [obj]
+        outer = {'holder': holder}
+        session = objgraph.GraphSession(obj, max_depth=2)
+        self.assertIn(objgraph._obj_node_id(outer), self.show(session))
+        session.prune('list')
+        output = self.show(session)
+        self.assertNotIn(objgraph._obj_node_id(holder), output)
+        self.assertNotIn(objgraph._obj_node_id(outer), output)
+        session.deepen()
+        self.assertNotIn(objgraph._obj_node_id(holder), self.show(session))
+
+    def test_prune_type(self):
+        holder = [self.MyClass(), []]
+        session = objgraph.GraphSession([holder], backrefs=False,
+                                        max_depth=1)
+        self.show(session)
+        session.prune(self.MyClass)
+        output = self.show(session)
+        self.assertNotIn(objgraph._obj_node_id(holder[0]), output)
+        self.assertIn(objgraph._obj_node_id(holder[1]), output)
+
+    def test_dead_objects_disappear(self):
+        holder = [self.MyClass()]
+        ref = weakref.ref(holder[0])
+        session = objgraph.GraphSession([holder], backrefs=False,
+                                        max_depth=1)
+        self.assertIn(objgraph._obj_node_id(ref()), self.show(session))
+        node_id = objgraph._obj_node_id(ref())
+        del holder[:]
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertNotIn(node_id, self.show(session))
+
+    def test_too_many(self):
+        obj = self.MyClass()
+        holders = [[obj], [obj], [obj]]
+        session = objgraph.GraphSession(obj, max_depth=1, too_many=1)
+        self.assertIn('"2 more backreferences"', self.show(session))
+        session = objgraph.GraphSession(
+            [holders], backrefs=False, max_depth=1, too_many=1,
+            filter=lambda x: x is not holders[0])
+        self.assertIn('"1 more references"', self.show(session))
+
+    def test_module(self):
+        session = objgraph.GraphSession([objgraph], backrefs=False,
+                                        max_depth=1)
+        self.assertIn('  %s[label="module\\nobjgraph",fillcolor="0.3,1,1"]'
+                      % objgraph._obj_node_id(objgraph), self.show(session))
+
+
 class FindChainTest(GarbageCollectedMixin, unittest.TestCase):
     """Tests for the find_chain function."""
 
@@ -213,6 +547,45 @@ class FindChainTest(GarbageCollectedMixin, unittest.TestCase):
             objgraph._find_chain(a, lambda x: False, gc.get_referrers))
 
 
+class FindBackrefPathsTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for the find_backref_paths function."""
+
+    def setUp(self):
+        super(FindBackrefPathsTest, self).setUp()
+        self.Session = type('Session', (), {'__module__': 'mymodule'})
+        self.sessions = [self.Session() for n in range(4)]
+        self.root = {'a': self.sessions[:2], 'b': {'k': self.sessions[2]}}
+
+    def find_backref_paths(self, **kw):
+        return objgraph.find_backref_paths(
+            self.sessions, lambda o: o is self.root, **kw)
+
+    def test_find_backref_paths(self):
+        root = self.root
+        a, b = root['a'], root['b']
+        s = self.sessions
+        self.assertEqual(
+            [(('dict', 'list', 'Session'), 2, [root, a, s[0]]),
+             (('Session',), 1, [s[3]]),
+             (('dict', 'dict', 'Session'), 1, [root, b, s[2]])],
+            self.find_backref_paths())
+
+    def test_max_depth(self):
+        s = self.sessions
+        self.assertEqual([(('Session',), 4, [s[0]])],
+                         self.find_backref_paths(max_depth=1))
+
+    def test_long_type_names(self):
+        paths = self.find_backref_paths(shortnames=False)
+        self.assertEqual(('builtins.dict', 'builtins.list',
+                          'mymodule.Session'), paths[0][0])
+
+    def test_root(self):
+        self.assertEqual([(('dict',), 1, [self.root])],
+                         objgraph.find_backref_paths(
+                             [self.root], lambda o: o is self.root))
+
+
 class CountTest(GarbageCollectedMixin, unittest.TestCase):
     """Tests for the count function."""
 
@@ -251,6 +624,191 @@ class TypestatsTest(GarbageCollectedMixin, unittest.TestCase):
         after = len(gc.get_referrers(x))
         self.assertEqual(before, after)
 
+    @mock.patch('objgraph._gil_enabled', mock.Mock(return_value=False))
+    def test_threads(self):
+        objects = [[], [], (), {}, [], {}, set()]
+        self.assertEqual({'list': 3, 'tuple': 1, 'dict': 2, 'set': 1},
+                         objgraph.typestats(objects, threads=3))
+        self.assertEqual({'list': 3},
+                         objgraph.typestats(objects, threads=3,
+                                            filter=lambda x: x == []))
+
+    @mock.patch('objgraph._gil_enabled', mock.Mock(return_value=False))
+    @mock.patch('os.cpu_count', mock.Mock(return_value=2))
+    def test_threads_default(self):
+        objects = [[], ()]
+        with mock.patch('objgraph._parallel_typestats') as parallel:
+            objgraph.typestats(objects)
+        parallel.assert_not_called()
+        with mock.patch('objgraph._PARALLEL_TYPESTATS_MIN', 2):
+            self.assertEqual({'list': 1, 'tuple': 1},
+                             objgraph.typestats(objects))
+            with mock.patch('objgraph._parallel_typestats') as parallel:
+                objgraph.typestats(objects)
+        parallel.assert_called_once_with(objects, objgraph._short_typename,
+                                         None, 2)
+
+    @mock.patch('objgraph._gil_enabled', mock.Mock(return_value=True))
+    def test_threads_with_gil(self):
+        with mock.patch('objgraph._parallel_typestats') as parallel:
+            stats = objgraph.typestats([[], ()], threads=4)
+        parallel.assert_not_called()
+        self.assertEqual({'list': 1, 'tuple': 1}, stats)
+
+
+class UntrackedTypestatsTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for the untracked_typestats function."""
+
+    def test_untracked_typestats(self):
+        s = 'x' * 1000
+        b = b'y' * 1000
+        objects = [[s, s, b, 12345678901], {'k': s}]
+        stats = objgraph.untracked_typestats(objects)
+        self.assertEqual((2, sys.getsizeof(s) + sys.getsizeof('k')),
+                         stats['str'])
+        self.assertEqual((1, sys.getsizeof(b)), stats['bytes'])
+        self.assertEqual((1, sys.getsizeof(12345678901)), stats['int'])
+        self.assertNotIn('list', stats)
+
+    def test_code_objects(self):
+        namespace = {}
+        exec('def func(local_name):\n'
+             '    return global_name, local_name, "%s"\n' % ('z' * 1000),
+             namespace)
+        gc.collect()  # untrack the tuples of constants and names
+        stats = objgraph.untracked_typestats([namespace['func']])
+        strings = objgraph.untracked_typestats(
+            [namespace['func']], filter=lambda o: isinstance(o, str))
+        self.assertGreater(strings['str'][1], 1000)
+        self.assertIn('code', stats)
+        self.assertGreaterEqual(stats['tuple'][0], 2)
+
+    def test_filter(self):
+        objects = [['x' * 1000, b'y' * 1000]]
+        stats = objgraph.untracked_typestats(
+            objects, filter=lambda o: isinstance(o, bytes))
+        self.assertEqual(['bytes'], list(stats))
+
+    def test_long_typename(self):
+        objects = [['x' * 1000]]
+        stats = objgraph.untracked_typestats(objects, shortnames=False)
+        self.assertEqual(['builtins.str'], list(stats))
+
+    def test_all_objects(self):
+        stats = objgraph.untracked_typestats()
+        self.assertGreater(stats['str'][0], 0)
+
+
+class CountInstancesTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for the count_instances decorator."""
+
+    def setUp(self):
+        super(CountInstancesTest, self).setUp()
+
+        @objgraph.count_instances
+        class Counted(object):
+            __module__ = 'mymodule'
+
+            def __init__(self, name=None):
+                self.name = name
+
+        class SubCounted(Counted):
+            def __init__(self):
+                super(SubCounted, self).__init__('sub')
+
+        self.Counted = Counted
+        self.SubCounted = SubCounted
+
+    def test_instance_counts(self):
+        objs = [self.Counted() for n in range(3)] + [self.SubCounted()]
+        self.assertEqual(3, objgraph.instance_counts()['Counted'])
+        self.assertEqual(1, objgraph.instance_counts()['SubCounted'])
+        self.assertEqual('sub', objs[-1].name)
+        del objs[1:]
+        self.assertEqual(1, objgraph.instance_counts()['Counted'])
+        self.assertNotIn('SubCounted', objgraph.instance_counts())
+
+    def test_reinit_counted_once(self):
+        x = self.Counted()
+        x.__init__()
+        self.assertEqual({'mymodule.Counted': 1},
+                         {name: n for name, n
+                          in objgraph.instance_counts(False).items()
+                          if name.startswith('mymodule.')})
+
+    def test_threads(self):
+        objs = []
+
+        def create():
+            for n in range(20000):
+                objs.append(self.Counted())
+                del objs[-100:-99]
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=create) for n in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        self.assertEqual(len(objs), objgraph.instance_counts()['Counted'])
+        del objs[:]
+        self.assertNotIn('Counted', objgraph.instance_counts())
+
+    def test_cycles(self):
+        x = self.Counted()
+        x.self = x
+        del x
+        self.assertEqual(1, objgraph.instance_counts()['Counted'])
+        gc.collect()
+        self.assertNotIn('Counted', objgraph.instance_counts())
+
+    def test_no_init(self):
+        @objgraph.count_instances
+        class WithNew(object):
+            def __new__(cls, name):
+                return super(WithNew, cls).__new__(cls)
+
+        Plain = objgraph.count_instances(type('Plain', (), {}))
+        x = WithNew('x')  # noqa
+        y = Plain()  # noqa
+        self.assertEqual(1, objgraph.instance_counts()['WithNew'])
+        self.assertEqual(1, objgraph.instance_counts()['Plain'])
+        self.assertRaises(TypeError, Plain, 'y')
+
+    def test_not_weakrefable(self):
+        NoWeakrefs = type('NoWeakrefs', (), {'__slots__': ()})
+        self.assertRaises(TypeError, objgraph.count_instances, NoWeakrefs)
+
+    def test_typestats_counted_only(self):
+        x = self.Counted()  # noqa
+        with mock.patch('gc.get_objects') as mock_get_objects:
+            stats = objgraph.typestats(counted_only=True)
+        self.assertEqual(1, stats['Counted'])
+        mock_get_objects.assert_not_called()
+
+    def test_typestats_counted_only_and_filter(self):
+        self.assertRaises(ValueError, objgraph.typestats, counted_only=True,
+                          filter=bool)
+
+    def test_show_growth_counted_only(self):
+        ps = {}
+        objgraph.show_growth(peak_stats=ps, counted_only=True,
+                             file=StringIO())
+        x = self.Counted()  # noqa
+        output = StringIO()
+        objgraph.show_growth(peak_stats=ps, counted_only=True, file=output)
+        self.assertEqual('Counted        1        +1\n', output.getvalue())
+
+    def test_show_growth_counted_only_default_peak_stats(self):
+        x = self.SubCounted()  # noqa
+        output = StringIO()
+        objgraph.show_growth(counted_only=True, file=output)
+        self.assertIn('SubCounted', output.getvalue())
+
 
 class TypestatsFilterArguTest(GarbageCollectedMixin, unittest.TestCase):
     """Tests for the typestats function, especially for augument
@@ -275,6 +833,148 @@ class TypestatsFilterArguTest(GarbageCollectedMixin, unittest.TestCase):
         self.assertEqual(1, stats['mymodule.MyClass'])
 
 
+class ModuleStatsTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for the module_stats function."""
+
+    def setUp(self):
+        super(ModuleStatsTest, self).setUp()
+        self.objects = [
+            type('A', (), {'__module__': 'pkg.mod'})(),
+            type('B', (), {'__module__': 'pkg.mod'})(),
+            type('C', (), {'__module__': 'pkg.other'})(),
+            type('D', (), {'__module__': 'pkg'})(),
+            type('E', (), {'__module__': None})(),
+        ]
+        self.size = sys.getsizeof(self.objects[0])
+
+    def test_module_stats(self):
+        size = self.size
+        self.assertEqual({'pkg': (4, 4 * size),
+                          'pkg.mod': (2, 2 * size),
+                          'pkg.other': (1, size),
+                          '?': (1, size)},
+                         objgraph.module_stats(self.objects))
+
+    def test_all_objects(self):
+        self.assertIn('builtins', objgraph.module_stats())
+
+    def test_filter(self):
+        self.assertEqual({'pkg': (1, self.size), 'pkg.other': (1, self.size)},
+                         objgraph.module_stats(
+                             self.objects,
+                             filter=lambda o: type(o).__name__ == 'C'))
+
+    def test_show_module_stats(self):
+        output = StringIO()
+        objgraph.show_module_stats(objects=self.objects, file=output)
+        size = self.size
+        self.assertEqual(textwrap.dedent('''\
+            pkg                4 %12d
+              pkg.mod          2 %12d
+              pkg.other        1 %12d
+            ?                  1 %12d
+        ''') % (4 * size, 2 * size, size, size), output.getvalue())
+
+    def test_show_module_stats_max_depth(self):
+        output = StringIO()
+        objgraph.show_module_stats(max_depth=1, objects=self.objects[:2],
+                                   file=output)
+        self.assertEqual('pkg        2 %12d\n' % (2 * self.size),
+                         output.getvalue())
+
+    def test_show_module_stats_nothing(self):
+        output = StringIO()
+        objgraph.show_module_stats(objects=[], file=output)
+        self.assertEqual('', output.getvalue())
+
+    def test_show_module_stats_stdout(self):
+        with mock.patch('sys.stdout', StringIO()) as stdout:
+            objgraph.show_module_stats(objects=self.objects[:1])
+        self.assertEqual('pkg              1 %12d\n  pkg.mod        1 %12d\n'
+                         % (self.size, self.size), stdout.getvalue())
+
+
+class ThreadStatsTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for the thread_stats function."""
+
+    def setUp(self):
+        super(ThreadStatsTest, self).setUp()
+        self.MyClass = type('MyClass', (), {'__module__': 'mymodule'})
+        self.started = threading.Event()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.worker,
+                                       name='test-worker')
+        self.thread.start()
+        self.started.wait()
+
+    def tearDown(self):
+        self.stop.set()
+        self.thread.join()
+        super(ThreadStatsTest, self).tearDown()
+
+    def worker(self):
+        objs = [self.MyClass() for n in range(3)]  # noqa
+        self.started.set()
+        self.stop.wait()
+
+    def test_thread_stats(self):
+        x = [self.MyClass()]  # noqa
+        stats = objgraph.thread_stats()
+        size = sys.getsizeof(x[0])
+        self.assertIn(('MyClass', 3, 3 * size), stats[self.thread.ident])
+        self.assertIn(('MyClass', 1, size), stats[threading.get_ident()])
+
+    def test_shared_objects(self):
+        self.shared = self.MyClass()
+        shared = self.shared  # noqa
+        stats = objgraph.thread_stats(shortnames=False)
+        self.assertIn(('mymodule.MyClass', 3, 3 * sys.getsizeof(shared)),
+                      stats[self.thread.ident])
+        self.assertNotIn('mymodule.MyClass',
+                         [name for name, count, size
+                          in stats.get(threading.get_ident(), [])])
+
+    def test_objects_shared_by_threads(self):
+        box = [self.MyClass()]
+        started = threading.Event()
+
+        def worker():
+            obj = box.pop()  # noqa
+            started.set()
+            self.stop.wait()
+
+        x = box[0]  # noqa
+        thread = threading.Thread(target=worker)
+        thread.start()
+        try:
+            started.wait()
+            stats = objgraph.thread_stats()
+        finally:
+            self.stop.set()
+            thread.join()
+        self.assertNotIn('MyClass',
+                         [name for name, count, size
+                          in stats.get(thread.ident, [])])
+        self.assertNotIn('MyClass',
+                         [name for name, count, size
+                          in stats.get(threading.get_ident(), [])])
+
+    def test_show_thread_stats(self):
+        output = StringIO()
+        objgraph.show_thread_stats(limit=None, file=output)
+        self.assertIn('test-worker (%d): ' % self.thread.ident,
+                      output.getvalue())
+        self.assertIn('  MyClass                     3 ', output.getvalue())
+
+    def test_show_thread_stats_limit(self):
+        with mock.patch('sys.stdout', StringIO()) as stdout:
+            objgraph.show_thread_stats(limit=1)
+        lines = stdout.getvalue().splitlines()
+        headers = [line for line in lines if not line.startswith('  ')]
+        self.assertEqual(2 * len(headers), len(lines))
+        self.assertIn('  MyClass ', stdout.getvalue())
+
+
 class GrowthTest(GarbageCollectedMixin, unittest.TestCase):
     """Tests for the growth function."""
 
@@ -292,6 +992,530 @@ class GrowthTest(GarbageCollectedMixin, unittest.TestCase):
         self.assertNotEqual(ps, {})
 
 
+@skipIf(not hasattr(objgraph.socket, 'AF_UNIX'), "no Unix sockets")
+class SnapshotTest(unittest.TestCase):
+    """Tests for Snapshot without NumPy."""
+
+    use_numpy = False
+
+    def setUp(self):
+        self.MyClass = type('MyClass', (), {'__module__': 'mymodule'})
+        self.a = self.MyClass()
+        self.b = [self.a]
+        self.c = {'b': self.b}
+        self.d = []
+        self.objects = [self.a, self.a.__dict__, self.b, self.c, self.d]
+
+    def snapshot(self, objects=None, shortnames=True):
+        if objects is None:
+            objects = self.objects
+        return objgraph.Snapshot(objects, shortnames=shortnames,
+                                 use_numpy=self.use_numpy)
+
+    def test_snapshot(self):
+        snapshot = self.snapshot()
+        self.assertEqual(5, len(snapshot))
+        self.assertEqual([id(o) for o in self.objects], list(snapshot.ids))
+        self.assertEqual(['MyClass', 'dict', 'list'], snapshot.type_names)
+
+    def test_typestats(self):
+        self.assertEqual({'MyClass': 1, 'dict': 2, 'list': 2},
+                         self.snapshot().typestats())
+        self.assertEqual({'mymodule.MyClass': 1, 'builtins.dict': 2,
+                          'builtins.list': 2},
+                         self.snapshot(shortnames=False).typestats())
+
+    def test_type_sizes(self):
+        self.assertEqual(
+            {'MyClass': sys.getsizeof(self.a),
+             'dict': sys.getsizeof(self.a.__dict__) + sys.getsizeof(self.c),
+             'list': sys.getsizeof(self.b) + sys.getsizeof(self.d)},
+            self.snapshot().type_sizes())
+
+    def test_in_degrees(self):
+        self.assertEqual([1, 1, 1, 0, 0],
+                         list(self.snapshot().in_degrees()))
+
+    def test_leaking_ids(self):
+        self.assertEqual([id(self.c), id(self.d)],
+                         self.snapshot().leaking_ids())
+
+    def test_new_ids(self):
+        older = self.snapshot(self.objects[:3])
+        self.assertEqual({'dict': {id(self.c)}, 'list': {id(self.d)}},
+                         self.snapshot().new_ids(older))
+        self.assertEqual({}, older.new_ids(self.snapshot()))
+
+    def test_reachable_ids(self):
+        snapshot = self.snapshot()
+        self.assertEqual({id(self.c), id(self.b), id(self.a),
+                          id(self.a.__dict__)},
+                         snapshot.reachable_ids([id(self.c)]))
+        self.assertEqual({id(self.d)}, snapshot.reachable_ids([id(self.d)]))
+        self.assertEqual(set(), snapshot.reachable_ids([id(self)]))
+
+    def test_reachable_ids_cycle(self):
+        a, b = [], []
+        a.append(b)
+        b.append(a)
+        snapshot = self.snapshot([a, b])
+        self.assertEqual({id(a), id(b)}, snapshot.reachable_ids([id(a)]))
+
+    def test_all_objects(self):
+        snapshot = objgraph.Snapshot(use_numpy=self.use_numpy)
+        self.assertIn(id(self.b), set(snapshot.ids))
+        self.assertGreater(snapshot.typestats()['dict'], 0)
+
+
+@skipIf(importlib.util.find_spec('numpy') is None,
+        "NumPy is not installed")
+class NumpySnapshotTest(SnapshotTest):
+    """Tests for Snapshot with NumPy."""
+
+    use_numpy = True
+
+    def test_default(self):
+        self.assertTrue(objgraph.Snapshot([]).use_numpy)
+
+
+class NoNumpySnapshotTest(unittest.TestCase):
+
+    @mock.patch.dict(sys.modules, numpy=None)
+    def test_default(self):
+        self.assertFalse(objgraph.Snapshot([]).use_numpy)
+
+    @mock.patch.dict(sys.modules, numpy=None)
+    def test_use_numpy(self):
+        self.assertRaises(ImportError, objgraph.Snapshot, [], use_numpy=True)
+
+
+class LeakDetectorTest(unittest.TestCase):
+    """Tests for LeakDetector."""
+
+    def test_leaks(self):
+        detector = objgraph.LeakDetector(size=20)
+        for i in range(30):
+            detector.sample({'Leak': 100 + i * 10 + i % 3,
+                             'Cache': 50 + (i % 2) * 1000,
+                             'Shrinking': 1000 - i,
+                             'Steady': 42})
+        leaks = detector.leaks()
+        self.assertEqual(['Leak'], [name for name, _, _, _ in leaks])
+        name, count, slope, t = leaks[0]
+        self.assertEqual(392, count)
+        self.assertGreater(slope, 0)
+        self.assertGreaterEqual(t, 3.0)
+
+    def test_not_enough_samples(self):
+        detector = objgraph.LeakDetector(size=20)
+        for i in range(5):
+            detector.sample({'Leak': i * 10})
+        self.assertEqual([], detector.leaks())
+        self.assertEqual(['Leak'],
+                         [name for name, _, _, _ in detector.leaks(3)])
+
+    def test_memory_is_bounded(self):
+        detector = objgraph.LeakDetector(size=5)
+        for i in range(20):
+            detector.sample({'Type%d' % i: 1})
+        self.assertEqual(20, detector.samples)
+        self.assertEqual(['Type%d' % i for i in range(15, 20)],
+                         sorted(detector._counts))
+        self.assertEqual([5] * 5,
+                         [len(counts) for counts in detector._counts.values()])
+
+    def test_size_too_small(self):
+        self.assertRaises(ValueError, objgraph.LeakDetector, size=2)
+
+    @mock.patch('objgraph.time.monotonic', lambda: 42.0)
+    def test_no_time_passed(self):
+        detector = objgraph.LeakDetector(size=5)
+        for i in range(5):
+            detector.sample({'Leak': i * 10})
+        self.assertEqual([], detector.leaks(3))
+
+    def test_sample_typestats(self):
+        detector = objgraph.LeakDetector()
+        detector.sample()
+        self.assertIn('dict', detector._counts)
+
+
+class TypeCountLogTest(TemporaryDirectoryMixin, unittest.TestCase):
+    """Tests for TypeCountLog."""
+
+    def test_series_and_growth(self):
+        with objgraph.TypeCountLog('counts.log') as log:
+            log.append({'dict': (10, 1000), 'list': (5, 200)}, timestamp=1)
+            log.append({'dict': (12, 1100), 'list': (5, 200)}, timestamp=2)
+            log.append({'dict': (11, 1050), 'Session': (3, 150)},
+                       timestamp=3)
+            self.assertEqual([(2.0, 12, 1100), (3.0, 11, 1050)],
+                             log.series('dict', 2, 3))
+            self.assertEqual([(1.0, 5, 200), (2.0, 5, 200), (3.0, 0, 0)],
+                             log.series('list'))
+            self.assertEqual([(1.0, 0, 0)], log.series('Unknown', t2=1.5))
+            self.assertEqual([('Session', 3, 3), ('dict', 11, 1)],
+                             log.growth())
+            self.assertEqual([('dict', 12, 2)], log.growth(1, 2))
+            self.assertEqual([('Session', 3, 3)], log.growth(2, limit=1))
+            self.assertEqual([], log.growth(4))
+
+    def test_reopen(self):
+        with objgraph.TypeCountLog('counts.log') as log:
+            log.append({'dict': (10, 1000)}, timestamp=1)
+            log.append({'dict': (-1, 0), u'\N{SNOWMAN}': (1, 1)},
+                       timestamp=2)
+        with objgraph.TypeCountLog('counts.log') as log:
+            log.append({'dict': (7, 700)}, timestamp=3)
+        with objgraph.TypeCountLog('counts.log') as log:
+            self.assertEqual([(1.0, 10, 1000), (2.0, -1, 0), (3.0, 7, 700)],
+                             log.series('dict'))
+            self.assertEqual([(2.0, 1, 1), (3.0, 0, 0)],
+                             log.series(u'\N{SNOWMAN}', 2))
+
+    def test_incomplete_record(self):
+        with objgraph.TypeCountLog('counts.log') as log:
+            log.append({'dict': (10, 1000)}, timestamp=1)
+            size = os.path.getsize('counts.log')
+            log.append({'dict': (20, 2000)}, timestamp=2)
+        with open('counts.log', 'rb+') as f:
+            f.truncate(os.path.getsize('counts.log') - 1)
+        with objgraph.TypeCountLog('counts.log') as log:
+            self.assertEqual(size, os.path.getsize('counts.log'))
+            self.assertEqual([(1.0, 10, 1000)], log.series('dict'))
+
+    def test_incomplete_type_name(self):
+        with objgraph.TypeCountLog('counts.log') as log:
+            log.append({'dict': (10, 1000)}, timestamp=1)
+            size = os.path.getsize('counts.log')
+            log.append({'Session': (1, 100)}, timestamp=2)
+        with open('counts.log', 'rb+') as f:
+            f.truncate(size + 4)
+        with objgraph.TypeCountLog('counts.log') as log:
+            self.assertEqual(size, os.path.getsize('counts.log'))
+            self.assertEqual([(1.0, 0, 0)], log.series('Session'))
+
+    def test_bad_stats(self):
+        with objgraph.TypeCountLog('counts.log') as log:
+            log.append({'dict': (10, 1000)}, timestamp=1)
+            size = os.path.getsize('counts.log')
+            self.assertRaises(TypeError, log.append, {'list': 5},
+                              timestamp=2)
+            self.assertRaises(TypeError, log.append, {'list': (5, 'x')},
+                              timestamp=2)
+            self.assertEqual(size, os.path.getsize('counts.log'))
+            log.append({'dict': (20, 2000), 'set': (1, 200)}, timestamp=3)
+            log.append({'set': (2, 400)}, timestamp=4)
+        with objgraph.TypeCountLog('counts.log') as log:
+            self.assertEqual([1.0, 3.0, 4.0], list(log.times))
+            self.assertEqual([(3.0, 1, 200), (4.0, 2, 400)],
+                             log.series('set', 3))
+            self.assertEqual([(1.0, 0, 0)], log.series('list', t2=1))
+
+    def test_bad_type_index(self):
+        with open('counts.log', 'wb') as f:
+            f.write(objgraph.TypeCountLog._magic + b'S'
+                    + struct.pack('<d', 1.0) + b'\x01\x05\x02\x02')
+        self.assertRaises(ValueError, objgraph.TypeCountLog, 'counts.log')
+        self.assertEqual(len(objgraph.TypeCountLog._magic) + 13,
+                         os.path.getsize('counts.log'))
+
+    def test_corrupted(self):
+        with objgraph.TypeCountLog('counts.log') as log:
+            log.append({'dict': (10, 1000)}, timestamp=1)
+        with open('counts.log', 'ab') as f:
+            f.write(b'X')
+        self.assertRaises(ValueError, objgraph.TypeCountLog, 'counts.log')
+
+    def test_not_a_log(self):
+        with open('counts.log', 'w') as f:
+            f.write('hello')
+        self.assertRaises(ValueError, objgraph.TypeCountLog, 'counts.log')
+
+    def test_compact(self):
+        with objgraph.TypeCountLog('counts.log') as log:
+            stats = {'Type%d' % i: (i, i * 100) for i in range(300)}
+            for i in range(1000):
+                stats['Type%d' % (i % 300)] = (i, i * 100)
+                log.append(stats, timestamp=i)
+        self.assertLess(os.path.getsize('counts.log'), 30000)
+
+    def test_append_typestats(self):
+        with objgraph.TypeCountLog('counts.log') as log:
+            log.append()
+            (timestamp, count, size), = log.series('dict')
+            self.assertGreater(count, 0)
+            self.assertGreater(size, 0)
+
+    def test_append_typestats_long_names(self):
+        with objgraph.TypeCountLog('counts.log', shortnames=False) as log:
+            log.append()
+            (timestamp, count, size), = log.series('builtins.dict')
+            self.assertGreater(count, 0)
+
+
+class TypestatsCollectorTest(TemporaryDirectoryMixin, unittest.TestCase):
+    """Tests for publish_typestats and TypestatsCollector."""
+
+    def setUp(self):
+        super(TypestatsCollectorTest, self).setUp()
+        self.collector = objgraph.TypestatsCollector('objgraph.sock')
+
+    def tearDown(self):
+        self.collector.close()
+        super(TypestatsCollectorTest, self).tearDown()
+
+    def test_nothing_received(self):
+        self.assertEqual(0, self.collector.receive())
+        self.assertEqual({}, self.collector.merged())
+        self.assertEqual([], self.collector.outliers())
+
+    def test_merged(self):
+        objgraph.publish_typestats('objgraph.sock', {'dict': 1}, worker=1)
+        objgraph.publish_typestats('objgraph.sock', {'dict': 5}, worker=1)
+        objgraph.publish_typestats('objgraph.sock', {'dict': 2, 'list': 3},
+                                   worker=2)
+        self.assertEqual(3, self.collector.receive(timeout=1))
+        self.assertEqual({'dict': 7, 'list': 3}, self.collector.merged())
+
+    def test_outliers(self):
+        for worker, count in enumerate([10, 12, 9, 5000, 11, 13]):
+            objgraph.publish_typestats('objgraph.sock',
+                                       {'Session': count, 'dict': 100},
+                                       worker=worker)
+        self.collector.receive(timeout=1)
+        self.assertEqual([(3, 'Session', 5000, 11.5)],
+                         self.collector.outliers())
+
+    def test_outliers_odd_number_of_workers(self):
+        for worker, count in enumerate([10, 5000, 12]):
+            objgraph.publish_typestats('objgraph.sock', {'Session': count},
+                                       worker=worker)
+        self.collector.receive(timeout=1)
+        self.assertEqual([(1, 'Session', 5000, 12)],
+                         self.collector.outliers())
+
+    def send(self, data):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect('objgraph.sock')
+        sock.sendall(data)
+        return sock
+
+    def test_bad_reports(self):
+        for data in [b'{"worker": 1, "sta', b'{"worker": 2}', b'[]']:
+            self.send(data).close()
+        objgraph.publish_typestats('objgraph.sock', {'dict': 1}, worker=3)
+        self.assertEqual(1, self.collector.receive(timeout=1))
+        self.assertEqual({3: {'dict': 1}}, self.collector.stats)
+
+    def test_stalled_worker(self):
+        self.collector.read_timeout = 0.1
+        sock = self.send(b'{"worker": 1, ')
+        try:
+            objgraph.publish_typestats('objgraph.sock', {'dict': 1},
+                                       worker=2)
+            start = time.perf_counter()
+            self.assertEqual(1, self.collector.receive())
+            self.assertLess(time.perf_counter() - start, 1)
+        finally:
+            sock.close()
+        self.assertEqual({2: {'dict': 1}}, self.collector.stats)
+
+    def test_publish_timeout(self):
+        stats = {'type%d' % n: n for n in range(100000)}
+        start = time.perf_counter()
+        self.assertRaises(socket.timeout, objgraph.publish_typestats,
+                          'objgraph.sock', stats, timeout=0.1)
+        self.assertLess(time.perf_counter() - start, 1)
+
+    def test_forget(self):
+        objgraph.publish_typestats('objgraph.sock', {'dict': 1}, worker=1)
+        self.collector.receive(timeout=1)
+        self.collector.forget(1)
+        self.collector.forget(2)
+        self.assertEqual({}, self.collector.stats)
+        self.assertEqual({}, self.collector.merged())
+
+    def test_max_age(self):
+        self.collector.max_age = 60
+        objgraph.publish_typestats('objgraph.sock', {'dict': 1}, worker=1)
+        objgraph.publish_typestats('objgraph.sock', {'dict': 2}, worker=2)
+        self.collector.receive(timeout=1)
+        self.collector.received_at[1] -= 61
+        objgraph.publish_typestats('objgraph.sock', {'dict': 3}, worker=3)
+        self.assertEqual(1, self.collector.receive(timeout=1))
+        self.assertEqual({2: {'dict': 2}, 3: {'dict': 3}},
+                         self.collector.stats)
+        self.assertEqual([2, 3], sorted(self.collector.received_at))
+
+    def test_default_stats(self):
+        objgraph.publish_typestats('objgraph.sock')
+        self.collector.receive(timeout=1)
+        self.assertIn('dict', self.collector.stats[os.getpid()])
+
+    def test_context_manager(self):
+        with objgraph.TypestatsCollector('other.sock'):
+            self.assertTrue(os.path.exists('other.sock'))
+        self.assertFalse(os.path.exists('other.sock'))
+
+
+class PrometheusMetricsTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for the prometheus_metrics function."""
+
+    def test_prometheus_metrics(self):
+        MyClass = type('MyClass', (), {'__module__': 'mymodule'})
+        x = MyClass()  # noqa
+        metrics = objgraph.prometheus_metrics(
+            shortnames=False, filter=lambda o: isinstance(o, MyClass))
+        self.assertEqual(
+            '# HELP objgraph_objects Number of objects tracked by the GC.\n'
+            '# TYPE objgraph_objects gauge\n'
+            'objgraph_objects{type="mymodule.MyClass"} 1\n'
+            '# HELP objgraph_object_bytes'
+            ' Total size of objects tracked by the GC.\n'
+            '# TYPE objgraph_object_bytes gauge\n'
+            'objgraph_object_bytes{type="mymodule.MyClass"} %d\n'
+            % sys.getsizeof(x), metrics)
+
+    def test_label_escaping(self):
+        MyClass = type('My\\"Class"\n', (), {'__module__': 'my\0module'})
+        x = MyClass()  # noqa
+        metrics = objgraph.prometheus_metrics(
+            shortnames=False, filter=lambda o: isinstance(o, MyClass))
+        self.assertIn('objgraph_objects{type="my\0module.'
+                      'My\\\\\\"Class\\"\\n"} 1\n', metrics)
+
+    def test_limit(self):
+        metrics = objgraph.prometheus_metrics(limit=2)
+        self.assertEqual(2, metrics.count('objgraph_objects{'))
+        self.assertEqual(2, metrics.count('objgraph_object_bytes{'))
+
+
+class MetricsServerTest(unittest.TestCase):
+    """Tests for the start_metrics_server function."""
+
+    def fetch(self, server):
+        import urllib.request
+        url = 'http://%s:%d/metrics' % server.server_address
+        with urllib.request.urlopen(url) as response:
+            return response.read().decode('utf-8')
+
+    @mock.patch('objgraph.prometheus_metrics')
+    def test_caching(self, mock_metrics):
+        mock_metrics.side_effect = ['first\n', 'second\n']
+        server = objgraph.start_metrics_server(0, limit=5)
+        try:
+            self.assertEqual('first\n', self.fetch(server))
+            self.assertEqual('first\n', self.fetch(server))
+        finally:
+            server.shutdown()
+            server.server_close()
+        mock_metrics.assert_called_once_with(5, True, None)
+
+    @mock.patch('objgraph.prometheus_metrics')
+    def test_expiry(self, mock_metrics):
+        mock_metrics.side_effect = ['first\n', 'second\n']
+        server = objgraph.start_metrics_server(0, ttl=-1)
+        try:
+            self.assertEqual('first\n', self.fetch(server))
+            self.assertEqual('second\n', self.fetch(server))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class BrowseTest(unittest.TestCase):
+    """Tests for the browse function."""
+
+    def setUp(self):
+        self.obj = TestObject('obj')
+        self.holder = {'attr': self.obj}
+        self.server = objgraph.browse(self.obj)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fetch(self, path, server=None, headers={}):
+        import urllib.request
+        server = server or self.server
+        request = urllib.request.Request(server.url + path, headers=headers)
+        with urllib.request.urlopen(request) as response:
+            return response.read().decode('utf-8')
+
+    def fetch_json(self, path, server=None):
+        return json.loads(self.fetch(path, server))
+
+    def test_page(self):
+        self.assertIn('<ul id="roots">', self.fetch(''))
+
+    def test_roots(self):
+        self.assertEqual(
+            {'nodes': [{'id': str(id(self.obj)),
+                        'label': ['TestObject', 'TestObject(obj)']}]},
+            self.fetch_json('roots'))
+
+    def test_expand(self):
+        result = self.fetch_json('expand?id=%d&dir=refs' % id(self.obj))
+        self.assertIn({'id': str(id('obj')), 'label': ['str', "'obj'"],
+                       'edge': ''}, result['nodes'])
+        self.assertEqual(0, result['more'])
+        self.assertEqual(result, self.fetch_json(
+            'expand?id=%d&dir=refs' % id(self.obj)))
+
+    def test_expand_backrefs(self):
+        result = self.fetch_json('expand?id=%d&dir=backrefs' % id(self.obj))
+        self.assertIn({'id': str(id(self.holder)),
+                       'label': ['dict', '1 items'], 'edge': 'attr'},
+                      result['nodes'])
+
+    def test_edge_labels_are_not_quoted(self):
+        holder = {'"quoted"': self.obj}
+        result = self.fetch_json('expand?id=%d&dir=backrefs' % id(self.obj))
+        self.assertIn({'id': str(id(holder)),
+                       'label': ['dict', '1 items'],
+                       'edge': 'str\n\'"quoted"\''}, result['nodes'])
+
+    def test_too_many_and_filter(self):
+        lst = [[], [], (), ()]
+        server = objgraph.browse([lst], too_many=1,
+                                 filter=lambda o: type(o) is list)
+        try:
+            result = self.fetch_json('expand?id=%d&dir=refs' % id(lst),
+                                     server)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(1, len(result['nodes']))
+        self.assertIn(result['nodes'][0]['id'],
+                      [str(id(lst[0])), str(id(lst[1]))])
+        self.assertEqual(1, result['more'])
+
+    def test_not_found(self):
+        import urllib.error
+        for path in ['expand?id=%d&dir=refs' % id(self), 'expand?id=x',
+                     'nonsense']:
+            with self.assertRaises(urllib.error.HTTPError) as cm:
+                self.fetch(path)
+            self.assertEqual(404, cm.exception.code)
+
+    def test_secret_path(self):
+        import urllib.error
+        import urllib.request
+        url = 'http://%s:%d/roots' % self.server.server_address
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            urllib.request.urlopen(url)
+        self.assertEqual(404, cm.exception.code)
+
+    def test_foreign_host(self):
+        import urllib.error
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self.fetch('roots', headers={'Host': 'evil.example.com:80'})
+        self.assertEqual(403, cm.exception.code)
+        self.assertIn('TestObject', self.fetch(
+            'roots', headers={'Host': 'localhost'}))
+
+
 class GetNewIdsTest(unittest.TestCase):
 
     maxDiff = None
@@ -320,6 +1544,81 @@ class GetNewIdsTest(unittest.TestCase):
         self.assertIn(id(x), new_ids['mymodule.MyClass'])
 
 
+class GetNewAllocationSitesTest(unittest.TestCase):
+
+    def setUp(self):
+        tracemalloc.start()
+
+    def tearDown(self):
+        tracemalloc.stop()
+
+    def test_get_new_allocation_sites(self):
+        MyClass = type('MyClass', (), {'__slots__': ()})
+        tracemalloc.stop()
+        untraced = [MyClass() for n in range(2)]
+        tracemalloc.start()
+        objs = [MyClass() for n in range(3)]
+        lineno = sys._getframe().f_lineno - 1
+        output = StringIO()
+        stats = objgraph.get_new_allocation_sites(
+            new_ids={'MyClass': set(map(id, objs + untraced))}, file=output)
+        site = '%s:%d' % (__file__, lineno)
+        self.assertEqual({('MyClass', site): (3, 3 * sys.getsizeof(objs[0])),
+                          ('MyClass', '?'): (2, 2 * sys.getsizeof(objs[0]))},
+                         stats)
+        self.assertIn('MyClass            3', output.getvalue())
+
+    def test_no_new_ids(self):
+        output = StringIO()
+        self.assertEqual({}, objgraph.get_new_allocation_sites(
+            new_ids={}, file=output))
+        self.assertEqual('', output.getvalue())
+
+    def test_get_new_ids(self):
+        objgraph.get_new_ids(limit=0)
+        objs = [type('MyClass', (), {'__slots__': ()})()]  # noqa
+        objgraph.get_new_ids(limit=0)
+        with mock.patch('sys.stdout', StringIO()) as stdout:
+            stats = objgraph.get_new_allocation_sites(limit=None)
+        self.assertIn('MyClass', [name for name, site in stats])
+        self.assertIn('MyClass', stdout.getvalue())
+
+    def test_not_tracing(self):
+        tracemalloc.stop()
+        self.assertRaises(RuntimeError, objgraph.get_new_allocation_sites)
+
+
+class GetNewObjectsTest(unittest.TestCase):
+
+    def setUp(self):
+        objgraph.get_new_objects(shortnames=True)
+
+    def test_get_new_objects(self):
+        x = type('MyClass', (), {'__module__': 'mymodule'})()
+        new_objects = objgraph.get_new_objects()
+        self.assertEqual([x], new_objects['MyClass'])
+        new_objects = objgraph.get_new_objects()
+        self.assertNotIn('MyClass', new_objects)
+
+    def test_limit_per_type(self):
+        a = [[] for n in range(10)]  # noqa
+        new_objects = objgraph.get_new_objects(limit_per_type=3)
+        self.assertEqual(3, len(new_objects['list']))
+
+    def test_weak(self):
+        x = type('MyClass', (), {'__module__': 'mymodule'})()
+        y = []
+        new_objects = objgraph.get_new_objects(weak=True, limit_per_type=None)
+        self.assertEqual([x], [ref() for ref in new_objects['MyClass']])
+        self.assertTrue(any(o is y for o in new_objects['list']))
+
+    def test_long_typename(self):
+        objgraph.get_new_objects(shortnames=False)
+        x = type('MyClass', (), {'__module__': 'mymodule'})()
+        new_objects = objgraph.get_new_objects()
+        self.assertEqual([x], new_objects['mymodule.MyClass'])
+
+
 def doctest_get_new_ids_prints():
     """Test for get_new_ids()
 
@@ -337,6 +1636,171 @@ def doctest_get_new_ids_prints():
     """
 
 
+class GetUnreachableObjectsTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for the get_unreachable_objects function."""
+
+    def leak(self, obj):
+        ctypes.pythonapi.Py_IncRef(ctypes.py_object(obj))
+        self.addCleanup(ctypes.pythonapi.Py_DecRef, ctypes.c_void_p(id(obj)))
+
+    def test_reachable(self):
+        a = [[]]
+        unreachable = objgraph.get_unreachable_objects()
+        self.assertFalse(any(o is a or o is a[0] for o in unreachable))
+
+    def test_unreachable_cycle(self):
+        a, b = [], []
+        a.append(b)
+        b.append(a)
+        self.leak(a)
+        ids = {id(a), id(b)}
+        del a, b
+        unreachable = objgraph.get_unreachable_objects()
+        self.assertEqual(ids, ids.intersection(map(id, unreachable)))
+
+    def test_extra_roots(self):
+        a = [[]]
+        self.leak(a)
+        ids = {id(a), id(a[0])}
+        roots = [(a,)]
+        del a
+        unreachable = objgraph.get_unreachable_objects(extra_roots=roots)
+        self.assertEqual(set(), ids.intersection(map(id, unreachable)))
+
+    def unreachable_in_fresh_interpreter(self):
+        output = subprocess.check_output(
+            [sys.executable, '-c', 'import objgraph\n'
+             'for obj in objgraph.get_unreachable_objects():\n'
+             '    print(type(obj).__name__)\n'],
+            cwd=os.path.dirname(os.path.abspath(objgraph.__file__)))
+        return output.decode('utf-8').split()
+
+    def test_static_types(self):
+        # Static types don't report their __dict__s to the GC, and some
+        # of them can only be found through their base classes.
+        names = self.unreachable_in_fresh_interpreter()
+        self.assertEqual([], [name for name in names
+                              if name.endswith('_descriptor')])
+
+    def test_is_subclass_registry(self):
+        MyClass = type('MyClass', (), {})
+        ref = weakref.ref(MyClass)
+        self.assertTrue(objgraph._is_subclass_registry({id(MyClass): ref}))
+        self.assertFalse(objgraph._is_subclass_registry({}))
+        self.assertFalse(objgraph._is_subclass_registry({1: ref}))
+        self.assertFalse(objgraph._is_subclass_registry({id(MyClass): 1}))
+        self.assertFalse(objgraph._is_subclass_registry(
+            {id(self): weakref.ref(self)}))
+
+    def test_fresh_interpreter(self):
+        # Most of the objects that only the interpreter refers to are the
+        # registries of subclasses (and the weak references in them).
+        names = self.unreachable_in_fresh_interpreter()
+        self.assertLess(len(names), 100)
+
+
+class FindCyclesTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for the find_cycles function."""
+
+    def test_no_cycles(self):
+        a = [[]]
+        self.assertEqual([], objgraph.find_cycles([a, a[0]]))
+
+    def test_self_reference(self):
+        a = []
+        a.append(a)
+        self.assertEqual([[a]], objgraph.find_cycles([a]))
+
+    def test_cycle(self):
+        a, b, c, d = [], [], [], []
+        a.append(b)
+        b.append(c)
+        c.append(a)
+        c.append(d)
+        self.assertEqual([[a, b, c]], objgraph.find_cycles([a, b, c, d]))
+
+    def test_all_objects(self):
+        x = type('MyClass', (), {})()
+        x.self = x
+        cycles = objgraph.find_cycles()
+        self.assertTrue(any(x in cycle for cycle in cycles))
+
+
+class CycleStatsTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for the cycle_stats function."""
+
+    def test_cycle_stats(self):
+        a, b, c = [], [], {}
+        a.append(a)
+        b.append(b)
+        c['c'] = c
+        self.assertEqual(
+            [((('list', 1),), 2, 2 * sys.getsizeof(a), a),
+             ((('dict', 1),), 1, sys.getsizeof(c), c)],
+            objgraph.cycle_stats(objects=[a, b, c]))
+
+    def test_limit_and_long_type_names(self):
+        a, b = [], {}
+        a.append(a)
+        b['b'] = b
+        b['c'] = b
+        self.assertEqual(
+            [((('builtins.dict', 1),), 1, sys.getsizeof(b), b)],
+            objgraph.cycle_stats(limit=1, objects=[a, b],
+                                 shortnames=False))
+
+    def test_show_cycle_stats(self):
+        a, b = [], {}
+        a.append(b)
+        b['a'] = a
+        output = StringIO()
+        objgraph.show_cycle_stats(objects=[a, b], file=output)
+        self.assertEqual(
+            '%7d %10d  dict, list\n' % (
+                1, sys.getsizeof(a) + sys.getsizeof(b)),
+            output.getvalue())
+
+    def test_show_cycle_stats_stdout(self):
+        a = []
+        a.append(a)
+        with mock.patch('sys.stdout', StringIO()) as stdout:
+            objgraph.show_cycle_stats(objects=[a])
+        self.assertEqual('%7d %10d  list\n' % (1, sys.getsizeof(a)),
+                         stdout.getvalue())
+
+
+class GarbageReportTest(GarbageCollectedMixin, unittest.TestCase):
+    """Tests for the garbage_report function."""
+
+    def test_garbage_report(self):
+        MyClass = type('MyClass', (), {})
+        flags = gc.get_debug()
+        with objgraph.garbage_report() as report:
+            for n in range(10):
+                x = MyClass()
+                x.self = x
+            del x
+        self.assertEqual(flags, gc.get_debug())
+        self.assertTrue(gc.isenabled())
+        self.assertEqual([], gc.garbage)
+        self.assertEqual(10, report.typestats['MyClass'])
+        self.assertEqual(sum(report.typestats.values()), report.collected)
+        self.assertIn(10, [count for composition, count, size
+                           in report.cycles
+                           if ('MyClass', 1) in composition])
+
+    def test_exception(self):
+        flags = gc.get_debug()
+        with self.assertRaises(ZeroDivisionError):
+            with objgraph.garbage_report():
+                x = []
+                x.append(x)
+                del x
+                1/0
+        self.assertEqual(flags, gc.get_debug())
+        self.assertEqual([], gc.garbage)
+
+
 class ByTypeTest(GarbageCollectedMixin, unittest.TestCase):
     """Tests for the by_test function."""
 
@@ -367,6 +1831,50 @@ class AtAddrsTest(unittest.TestCase):
         self.assertIn(a, new_lists)
 
 
+class TrackTest(unittest.TestCase):
+    """Tests for the track function and friends."""
+
+    def setUp(self):
+        self.MyClass = type('MyClass', (), {})
+        objgraph._tracked.clear()
+        objgraph._tracked_lifetimes.clear()
+
+    def test_tracked_counts(self):
+        x = objgraph.track(self.MyClass())
+        y = objgraph.track(self.MyClass(), 'special')  # noqa
+        self.assertEqual({'MyClass': 1, 'special': 1},
+                         objgraph.tracked_counts())
+        del x
+        self.assertEqual({'special': 1}, objgraph.tracked_counts())
+
+    def test_not_weakrefable(self):
+        self.assertRaises(TypeError, objgraph.track, [])
+
+    @mock.patch('time.monotonic', lambda: 100.0)
+    def test_tracked_survivors(self):
+        x = objgraph.track(self.MyClass(), 'x')
+        with mock.patch('time.monotonic', lambda: 150.0):
+            y = objgraph.track(self.MyClass(), 'y')
+        with mock.patch('time.monotonic', lambda: 200.0):
+            self.assertEqual([('x', 100.0, x), ('y', 50.0, y)],
+                             objgraph.tracked_survivors(10))
+            self.assertEqual([('x', 100.0, x)],
+                             objgraph.tracked_survivors(60))
+            self.assertEqual([('y', 50.0, y)],
+                             objgraph.tracked_survivors(10, 'y'))
+
+    def test_lifetime_histogram(self):
+        self.assertEqual([0] * 9, [count for max_lifetime, count
+                                   in objgraph.lifetime_histogram('x')])
+        with mock.patch('time.monotonic', lambda: 100.0):
+            x = objgraph.track(self.MyClass(), 'x')
+        with mock.patch('time.monotonic', lambda: 105.0):
+            del x
+        self.assertEqual([(0.001, 0), (0.01, 0), (0.1, 0), (1, 0), (10, 1),
+                          (60, 0), (600, 0), (3600, 0), (float('inf'), 0)],
+                         objgraph.lifetime_histogram('x'))
+
+
 class StringRepresentationTest(GarbageCollectedMixin,
                                unittest.TestCase):
     """Tests for the string representation of objects and edges."""
@@ -510,6 +2018,95 @@ def sample_func():
     pass
 
 
+class DescribeChainTest(unittest.TestCase):
+    """Tests for the describe_chain function."""
+
+    def test_describe_chain(self):
+        obj = TestObject('A')
+        self.assertEqual([['list', '1 items'],
+                          ['TestObject', 'TestObject(A)']],
+                         objgraph.describe_chain([[obj], obj]))
+
+    def test_long_type_names(self):
+        typename = TestObject.__module__ + '.TestObject'
+        self.assertEqual([[typename, 'TestObject(A)']],
+                         objgraph.describe_chain([TestObject('A')],
+                                                 shortnames=False))
+
+
+@skipIf(not hasattr(os, 'fork'), "os.fork() is not available")
+class InForkTest(unittest.TestCase):
+    """Tests for the in_fork function."""
+
+    def test_result(self):
+        self.assertEqual({'pid': os.getpid(), 'args': [1, 2], 'x': 3},
+                         objgraph.in_fork(lambda *args, **kw: dict(
+                             pid=os.getppid(), args=args, **kw), 1, 2, x=3))
+
+    def test_error(self):
+        with self.assertRaises(RuntimeError) as cm:
+            objgraph.in_fork(lambda: 1/0)
+        self.assertIn('ZeroDivisionError', str(cm.exception))
+
+    def test_timeout(self):
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            objgraph.in_fork(time.sleep, 60, timeout=0.1)
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertEqual([3], objgraph.in_fork(lambda: [3], timeout=10))
+
+    @mock.patch('os.fork', lambda: 12345)
+    @mock.patch('os.waitpid', lambda pid, options: (pid, 0))
+    def test_no_result(self):
+        # simulate a child that crashed before writing anything: the parent
+        # closes the only writing end of the pipe and reads EOF
+        with self.assertRaises(RuntimeError) as cm:
+            objgraph.in_fork(lambda: None)
+        self.assertEqual('child process 12345 exited without a result',
+                         str(cm.exception))
+
+
+class BoundedReprTest(unittest.TestCase):
+    """Tests for the bounded repr used in node labels."""
+
+    def tearDown(self):
+        objgraph.set_repr_limits()
+
+    def test_long_string(self):
+        self.assertEqual("'" + 'x' * 39, objgraph._short_repr('x' * 10**6))
+
+    def test_huge_int(self):
+        self.assertEqual('<int with 100001 bits>',
+                         objgraph._short_repr(2**100000))
+
+    def test_class_named_like_a_builtin(self):
+        for name in ['str', 'bytes', 'int', 'list']:
+            MyClass = type(name, (), {'__repr__': lambda self: 'custom'})
+            self.assertEqual('custom', objgraph._short_repr(MyClass()))
+
+    def test_maxlen(self):
+        objgraph.set_repr_limits(maxlen=5)
+        self.assertEqual('TestO', objgraph._short_repr(TestObject('A')))
+
+    def test_skip_types(self):
+        objgraph.set_repr_limits(skip_types=[TestObject])
+        self.assertEqual('<TestObject>',
+                         objgraph._short_repr(TestObject('A')))
+
+    def test_time_limit(self):
+        class SlowRepr(object):
+            calls = 0
+
+            def __repr__(self):
+                SlowRepr.calls += 1
+                return 'SlowRepr()'
+
+        objgraph.set_repr_limits(time_limit=-1)
+        self.assertEqual('SlowRepr()', objgraph._short_repr(SlowRepr()))
+        self.assertEqual('<SlowRepr>', objgraph._short_repr(SlowRepr()))
+        self.assertEqual(1, SlowRepr.calls)
+
+
 class StubSubprocess(object):
 
     should_fail = False